@@ -17,3 +17,4 @@ admin.site.register(models.Quiz)
 admin.site.register(models.MultipleChoiceQuestion)
 admin.site.register(models.TrueFalseQuestion)
 admin.site.register(models.Answer)
+admin.site.register(models.OutboxMessage)
@@ -0,0 +1,139 @@
+'''JSON endpoints behind the client-side quiz page (quiz_app.html).
+
+Content comes from the cached quiz payload and is the same for every
+student, so it is answered with an ETag of the payload version; attempts
+and submissions are per user. Responses use short keys and no whitespace.'''
+import json
+from functools import wraps
+
+from django.http import Http404, JsonResponse
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import etag, require_GET, require_POST
+
+from .grading import IncompleteSubmission, save_result, start_attempt
+from .payload import existing_quiz_version, get_quiz_payload
+
+COMPACT = {'separators': (',', ':')}
+
+
+def api_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params=COMPACT)
+
+
+def api_error(message, status, **extra):
+    return api_response(dict(extra, error=message), status=status)
+
+
+def api_login_required(view):
+    '''Answers anonymous requests with 401 rather than a login redirect'''
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return api_error('Authentication required', 401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def published_payload(quiz_pk):
+    payload = get_quiz_payload(quiz_pk)
+    if payload is None or not payload.quiz.course.published:
+        raise Http404
+    return payload
+
+
+def read_json(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def content_etag(request, quiz_pk):
+    version = existing_quiz_version(quiz_pk)
+    # no ETag for a missing quiz, so the view answers 404
+    return None if version is None else 'quiz-{}-{}'.format(quiz_pk, version)
+
+
+def attempt_data(attempt, payload):
+    # answer order of shuffled questions only, the rest keep the content order
+    shuffled = {
+        question.pk: [answer.pk for answer in question.answers]
+        for question in payload.key.shuffled_for(attempt) if question.shuffle_answers
+    }
+    return {
+        'id': attempt.pk,
+        'completed': attempt.completed,
+        'score': attempt.correct_answers,
+        'order': shuffled,
+    }
+
+
+@api_login_required
+@require_GET
+@gzip_page
+@etag(content_etag)
+def quiz_content(request, quiz_pk):
+    payload = published_payload(quiz_pk)
+    quiz = payload.quiz
+    response = api_response({
+        'id': quiz.pk,
+        'title': quiz.title,
+        'course': {'id': quiz.course_id, 'title': quiz.course.title},
+        'version': payload.version,
+        'questions': [
+            {
+                'id': question.pk,
+                'prompt': question.prompt,
+                'text': question.free_text,
+                'answers': [[answer.pk, answer.text] for answer in question.answers],
+            }
+            for question in payload.key
+        ],
+    })
+    # the same for every student; revalidated against the ETag on each use
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@api_login_required
+@require_POST
+def quiz_attempt(request, quiz_pk):
+    '''Starts an attempt, or resumes the current one; {"retake": true}
+    replaces a completed attempt with a new one'''
+    payload = published_payload(quiz_pk)
+    data = read_json(request)
+    if data is None:
+        return api_error('Expected a JSON object', 400)
+    attempt = start_attempt(request.user, quiz_pk, retake=bool(data.get('retake')))
+    return api_response(attempt_data(attempt, payload))
+
+
+@api_login_required
+@require_POST
+@gzip_page
+def quiz_submit(request, quiz_pk):
+    '''Grades {"answers": {question id: answer id or text}} and stores the result'''
+    payload = published_payload(quiz_pk)
+    data = read_json(request)
+    if data is None or not isinstance(data.get('answers'), dict):
+        return api_error('Expected {"answers": {...}}', 400)
+    attempt = request.user.quiztaker_set.filter(quiz_id=quiz_pk).first()
+    if attempt is None:
+        return api_error('Start an attempt first', 409)
+
+    answers = {str(key): str(value) for key, value in data['answers'].items()}
+    try:
+        result = payload.key.grade(answers)
+    except IncompleteSubmission as error:
+        return api_error(str(error), 400, question=error.question.pk)
+    save_result(attempt, result)
+
+    return api_response({
+        'score': result.correct_answers,
+        'total': result.total,
+        'results': [
+            [item.question.pk, item.correct, item.correct_answer.text if item.correct_answer else None]
+            for item in result
+        ],
+    })
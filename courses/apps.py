@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CoursesConfig(AppConfig):
     name = 'courses'
+
+    def ready(self):
+        # connect signal handlers
+        from . import signals
+        post_migrate.connect(signals.create_search_table, sender=self)
+        post_migrate.connect(signals.create_email_index, sender=self)
@@ -0,0 +1,74 @@
+'''Async versions of the read-only catalogue views, routed in place of the
+sync ones when ASYNC_VIEWS is on (learning_site/asgi.py switches it on).
+
+Everything a template needs is loaded here through the async ORM, and the
+user is resolved with request.auser(), so rendering never queries the
+database from the event loop.'''
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render
+
+from . import models
+from . import search as search_index
+from .outline import aget_steps_html
+from .pagination import apaginate_by_pk, decode_cursor, encode_cursor
+from .views import COURSES_PER_PAGE, SEARCH_RESULTS_PER_PAGE
+
+
+async def load_user(request):
+    # replaces the lazy request.user, which would query synchronously in the template
+    request.user = await request.auser()
+
+
+async def course_list(request):
+    await load_user(request)
+    courses = models.Course.objects.filter(published=True)
+    page = await apaginate_by_pk(courses, request.GET.get('after'), COURSES_PER_PAGE)
+    context = {'courses': page.items, 'next_cursor': page.next_cursor}
+    return render(request, 'courses/course_list.html', context)
+
+
+async def course_detail(request, pk):
+    await load_user(request)
+    course = await aget_object_or_404(models.Course, pk=pk, published=True)
+    context = {'course': course, 'steps_html': await aget_steps_html(course.pk)}
+    return render(request, 'courses/course_detail.html', context)
+
+
+async def text_detail(request, course_pk, step_pk):
+    await load_user(request)
+    step = await aget_object_or_404(models.Text.objects.select_related('course'),
+                                    course_id=course_pk, pk=step_pk, course__published=True)
+    context = {'step': step, 'steps_html': await aget_steps_html(course_pk)}
+    return render(request, 'courses/text_detail.html', context)
+
+
+async def courses_by_teacher(request, teacher):
+    await load_user(request)
+    courses = models.Course.objects.filter(teacher__username=teacher, published=True)
+    page = await apaginate_by_pk(courses, request.GET.get('after'), COURSES_PER_PAGE)
+    return render(request, 'courses/course_list.html', {
+        'courses': page.items,
+        'next_cursor': page.next_cursor,
+    })
+
+
+async def search(request):
+    await load_user(request)
+    term = request.GET.get('q', '').strip()
+    after = decode_cursor(request.GET.get('after'), length=2)
+    per_page = SEARCH_RESULTS_PER_PAGE
+
+    # the full-text query is raw SQL, which has no async interface
+    hits = await sync_to_async(search_index.search)(term, limit=per_page + 1, after=after)
+    next_cursor = None
+    if len(hits) > per_page:
+        hits = hits[:per_page]
+        next_cursor = encode_cursor(search_index.hit_cursor(hits[-1]))
+
+    context = {
+        'term': term,
+        'hits': hits,
+        'next_cursor': next_cursor,
+        'paginated': after is not None,
+    }
+    return render(request, 'courses/search_results.html', context)
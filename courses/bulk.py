@@ -0,0 +1,41 @@
+from django.db import connection
+
+from . import models
+
+
+def bulk_create_questions(questions, batch_size=1000):
+    '''Inserts MultipleChoiceQuestion, TrueFalseQuestion and UserInputQuestion
+    instances in batches.
+
+    bulk_create() refuses multi-table inherited models, so the Question rows
+    are bulk created first and the child rows are then written with one
+    executemany() per question type. Sets the primary keys on `questions`.'''
+    questions = list(questions)
+    parents = [
+        models.Question(quiz_id=question.quiz_id, order=question.order,
+                        prompt=question.prompt, question_type=question.question_type)
+        for question in questions
+    ]
+    models.Question.objects.bulk_create(parents, batch_size=batch_size)
+
+    by_model = {}
+    for question, parent in zip(questions, parents):
+        question.pk = question.question_ptr_id = parent.pk
+        question.question_ptr = parent
+        question._state.adding = False
+        by_model.setdefault(type(question), []).append(question)
+
+    with connection.cursor() as cursor:
+        for model, rows in by_model.items():
+            fields = model._meta.local_concrete_fields
+            sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                connection.ops.quote_name(model._meta.db_table),
+                ', '.join(connection.ops.quote_name(field.column) for field in fields),
+                ', '.join(['%s'] * len(fields)),
+            )
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(sql, [
+                    [field.get_db_prep_save(getattr(row, field.attname), connection) for field in fields]
+                    for row in rows[start:start + batch_size]
+                ])
+    return questions
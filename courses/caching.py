@@ -0,0 +1,36 @@
+import time
+
+from django.core.cache import cache
+
+
+def _fresh_version():
+    # start from the clock so a version evicted from the cache is never reused
+    return int(time.time() * 1000)
+
+
+def get_version(key):
+    '''Returns the current value of a version counter kept in the shared cache'''
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_version(), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(key):
+    '''Async counterpart of get_version, using the cache's async methods'''
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _fresh_version(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(key):
+    '''Moves a version counter on, orphaning every cache entry keyed by the old value'''
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _fresh_version()
+        cache.set(key, version, None)
+        return version
@@ -0,0 +1,37 @@
+from django.core.cache import cache
+
+from . import models
+from .caching import bump_version, get_version
+
+
+CATALOGUE_CACHE_TIMEOUT = 60 * 60 * 24
+NEWEST_COURSES_COUNT = 5
+
+CATALOGUE_VERSION_KEY = 'courses:catalogue-version'
+
+
+def catalogue_version():
+    '''Version of the published catalogue, moved on whenever a course is added,
+    removed, published, unpublished or renamed'''
+    return get_version(CATALOGUE_VERSION_KEY)
+
+
+def newest_courses_cache_key(version):
+    return 'courses:newest:{}'.format(version)
+
+
+def newest_courses():
+    '''Returns the most recently added published courses, newest first'''
+    key = newest_courses_cache_key(catalogue_version())
+    courses = cache.get(key)
+    if courses is None:
+        courses = list(
+            models.Course.objects.filter(published=True)
+            .order_by('-created_at', '-pk')[:NEWEST_COURSES_COUNT]
+        )
+        cache.set(key, courses, CATALOGUE_CACHE_TIMEOUT)
+    return courses
+
+
+def invalidate_catalogue():
+    bump_version(CATALOGUE_VERSION_KEY)
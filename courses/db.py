@@ -0,0 +1,48 @@
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+
+LOCK_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and any(message in str(error) for message in LOCK_MESSAGES)
+
+
+def configure_sqlite(connection):
+    '''Applies SQLITE_PRAGMAS to a freshly opened SQLite connection'''
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+def retry_on_lock(func):
+    '''Retries `func`, which should make its writes in one transaction, with
+    jittered exponential backoff while SQLite reports the database as locked.
+
+    Gives up after DATABASE_LOCK_RETRIES retries. Inside an enclosing atomic
+    block the call is not retried, as only the outermost transaction can be.'''
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if transaction.get_connection().in_atomic_block:
+            return func(*args, **kwargs)
+        retries = getattr(settings, 'DATABASE_LOCK_RETRIES', 5)
+        delay = getattr(settings, 'DATABASE_LOCK_BACKOFF', 0.05)
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if attempt == retries or not is_lock_error(error):
+                    raise
+            # full jitter spreads out writers that collided at the same moment
+            time.sleep(random.uniform(0, min(delay * 2 ** attempt, 1.0)))
+    return wrapper
@@ -0,0 +1,112 @@
+import csv
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Count
+
+EMAIL_INDEX = 'auth_user_email_uniq'
+# SQLite only uses a partial index for queries that repeat its WHERE clause
+# as written, so it is shared with users_with_email()
+EMAIL_INDEX_WHERE = "email != ''"
+COHORT_FIELDS = ['username', 'email', 'first_name', 'last_name', 'password']
+
+logger = logging.getLogger(__name__)
+
+
+def create_email_index():
+    '''Adds a unique index on auth_user.email, leaving blank emails out of it,
+    so the registration form's email check is an index lookup'''
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} (email) WHERE {}".format(
+                    EMAIL_INDEX, User._meta.db_table, EMAIL_INDEX_WHERE)
+            )
+    except IntegrityError:
+        # existing duplicates have to be merged by hand before the index can exist
+        duplicates = (User.objects.exclude(email='').values('email')
+                      .annotate(users=Count('pk')).filter(users__gt=1)
+                      .order_by('email').values_list('email', flat=True))
+        logger.warning('Unique index %s on user emails not created; these emails belong to more '
+                       'than one user: %s', EMAIL_INDEX, ', '.join(duplicates))
+        return False
+    return True
+
+
+def users_with_email(email):
+    '''Users with a non-blank email, looked up through EMAIL_INDEX. The
+    literal condition matters: exclude(email='') binds '' as a parameter,
+    which the planner cannot match to the index.'''
+    return User.objects.filter(email=email).extra(where=[EMAIL_INDEX_WHERE])
+
+
+def read_cohort(file):
+    '''Parses a cohort CSV with a header row of COHORT_FIELDS.
+
+    Returns (users, errors): unsaved User instances with their raw password
+    in `password`, and (line number, message) pairs for rejected rows.
+    Usernames and emails are checked against one preloaded set each.'''
+    reader = csv.DictReader(file)
+    missing = set(COHORT_FIELDS) - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError('Missing columns: {}'.format(', '.join(sorted(missing))))
+
+    usernames = set(User.objects.values_list('username', flat=True))
+    emails = set(User.objects.exclude(email='').values_list('email', flat=True))
+    username_field = User._meta.get_field('username')
+    users, errors = [], []
+    for row in reader:
+        line = reader.line_num
+        row = {field: (row[field] or '').strip() for field in COHORT_FIELDS}
+        email = User.objects.normalize_email(row['email'])
+        try:
+            username_field.run_validators(row['username'])
+            validate_email(email)
+        except ValidationError as error:
+            errors.append((line, ' '.join(error.messages)))
+            continue
+        if not row['password']:
+            errors.append((line, 'Password is empty'))
+        elif row['username'] in usernames:
+            errors.append((line, 'Username {} is already taken'.format(row['username'])))
+        elif email in emails:
+            errors.append((line, 'Email {} is already taken'.format(email)))
+        else:
+            usernames.add(row['username'])
+            emails.add(email)
+            users.append(User(username=row['username'], email=email, first_name=row['first_name'],
+                              last_name=row['last_name'], password=row['password']))
+    return users, errors
+
+
+def hash_passwords(passwords, processes=None):
+    '''Hashes `passwords` with the default hasher, spread over `processes`
+    forked workers (one per core by default)'''
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    # workers only hash, but must not inherit open database connections
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    chunksize = max(1, len(passwords) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def enroll(users, batch_size=500, processes=None):
+    '''Hashes the raw passwords of unsaved `users` and inserts them in chunks,
+    all or nothing'''
+    hashes = hash_passwords([user.password for user in users], processes)
+    for user, password in zip(users, hashes):
+        user.password = password
+    with transaction.atomic():
+        for start in range(0, len(users), batch_size):
+            User.objects.bulk_create(users[start:start + batch_size])
+    return users
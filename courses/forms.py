@@ -1,3 +1,5 @@
+import re
+
 from django import forms
 
 from . import models
@@ -55,6 +57,35 @@ class AnswerForm(forms.ModelForm):
         ]
 
 
+class VideoUploadForm(forms.ModelForm):
+    class Meta:
+        model = models.VideoUpload
+        fields = [
+            'step',
+            'filename',
+            'size',
+            'checksum',
+        ]
+
+    def clean_size(self):
+        size = self.cleaned_data['size']
+        if size <= 0:
+            raise forms.ValidationError('The file is empty')
+        return size
+
+    def clean_checksum(self):
+        checksum = self.cleaned_data['checksum'].lower()
+        if checksum and not re.match(r'^[0-9a-f]{64}$', checksum):
+            raise forms.ValidationError('Expected a hex SHA-256 digest')
+        return checksum
+
+
+class QuizImportForm(forms.Form):
+    file = forms.FileField(help_text='A quiz exported as .json or .csv')
+    title = forms.CharField(max_length=255, required=False, help_text='Required for CSV files')
+    description = forms.CharField(required=False)
+
+
 # take quiz forms
 class TakeQuestion(forms.Form):
     pass
@@ -0,0 +1,174 @@
+import random
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import F
+
+from . import models, question_types
+from .db import retry_on_lock
+from .stats import record_responses
+
+
+# in-memory answer key entries, built once per submission
+KeyAnswer = namedtuple('KeyAnswer', ['pk', 'text', 'correct'])
+# free_text: answered by typing rather than picking one of `answers`
+KeyQuestion = namedtuple('KeyQuestion', ['pk', 'order', 'prompt', 'question_type', 'free_text', 'answers',
+                                         'correct_answer', 'shuffle_answers'])
+
+# one graded row of quiz_result.html
+GradedQuestion = namedtuple('GradedQuestion', ['question', 'your_answer', 'correct_answer', 'correct'])
+
+
+class IncompleteSubmission(Exception):
+    '''Raised when a submission is missing an answer for a question'''
+
+    def __init__(self, question):
+        super().__init__("You didn't answer a question")
+        self.question = question
+
+
+class QuizResult:
+    '''Outcome of grading one submission'''
+
+    def __init__(self, graded):
+        self.graded = graded
+        self.correct_answers = sum(1 for item in graded if item.correct)
+        self.total = len(graded)
+
+    def __iter__(self):
+        return iter(self.graded)
+
+    def __len__(self):
+        return self.total
+
+
+class AnswerKey:
+    '''Every question and answer of a quiz, loaded in one prefetch'''
+
+    def __init__(self, questions):
+        self.questions = questions
+
+    @classmethod
+    def for_quiz(cls, quiz_pk):
+        questions = []
+        queryset = question_types.with_subtypes(
+            models.Question.objects.filter(quiz_id=quiz_pk)).prefetch_related('answer_set')
+        for question in queryset:
+            answers = [KeyAnswer(answer.pk, answer.text, answer.correct)
+                       for answer in question.answer_set.all()]
+            correct_answer = next((answer for answer in answers if answer.correct), None)
+            questions.append(KeyQuestion(
+                question.pk, question.order, question.prompt, question.question_type,
+                question_types.get_type(question.question_type).free_text, answers, correct_answer,
+                getattr(question_types.concrete(question), 'shuffle_answers', False),
+            ))
+        return cls(questions)
+
+    def shuffled_for(self, quiz_taker):
+        '''The questions with answers in the order shown to one attempt.
+
+        Questions with shuffle_answers are shuffled by a generator seeded
+        with the attempt and question pks, so the order survives reloads
+        and can be rebuilt later without storing it.'''
+        questions = []
+        for question in self.questions:
+            if question.shuffle_answers:
+                answers = list(question.answers)
+                random.Random('{}:{}'.format(quiz_taker.pk, question.pk)).shuffle(answers)
+                question = question._replace(answers=answers)
+            questions.append(question)
+        return questions
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def result_for(self, quiz_taker):
+        '''Rebuilds the result of a completed attempt from its stored answers'''
+        stored = {
+            question_id: (answer_id, text, correct)
+            for question_id, answer_id, text, correct in models.AttemptAnswer.objects.filter(
+                attempt_id=quiz_taker.pk,
+            ).values_list('question_id', 'answer_id', 'text', 'correct')
+        }
+        graded = []
+        for question in self.questions:
+            if question.pk not in stored:
+                continue
+            answer_id, text, correct = stored[question.pk]
+            if question.free_text:
+                your_answer = text
+            else:
+                your_answer = next((answer for answer in question.answers if answer.pk == answer_id), None)
+            graded.append(GradedQuestion(question, your_answer, question.correct_answer, correct))
+        return QuizResult(graded)
+
+    def grade(self, data):
+        '''Grades submitted form data keyed by question pk in a single pass'''
+        graded = []
+        for question in self.questions:
+            submitted = data.get(str(question.pk))
+            if submitted is None:
+                raise IncompleteSubmission(question)
+
+            your_answer, correct = question_types.get_type(question.question_type).grade(question, submitted)
+            if your_answer is None:
+                raise IncompleteSubmission(question)
+
+            graded.append(GradedQuestion(question, your_answer, question.correct_answer, correct))
+        return QuizResult(graded)
+
+
+@retry_on_lock
+def start_attempt(user, quiz_pk, retake=False):
+    '''Returns the user's QuizTaker for a quiz, replacing a previous attempt on a retake'''
+    with transaction.atomic():
+        if retake:
+            previous = models.AttemptAnswer.objects.filter(attempt__user=user, attempt__quiz_id=quiz_pk)
+            record_responses(list(previous.only('question_id', 'answer_id', 'correct')), delta=-1)
+            attempts = user.quiztaker_set.filter(quiz_id=quiz_pk)
+            # times_taken counts completed attempts that still exist, as reconcile_quiz_counters does
+            completed = attempts.filter(completed=True).count()
+            attempts.delete()
+            if completed:
+                models.Quiz.objects.filter(pk=quiz_pk).update(times_taken=F('times_taken') - completed)
+        quiz_taker, created = user.quiztaker_set.get_or_create(quiz_id=quiz_pk)
+    return quiz_taker
+
+
+def attempt_answers(quiz_taker, result):
+    '''Turns a graded submission into unsaved AttemptAnswer rows'''
+    rows = []
+    for item in result:
+        if item.question.free_text:
+            rows.append(models.AttemptAnswer(attempt_id=quiz_taker.pk, question_id=item.question.pk,
+                                             text=item.your_answer, correct=item.correct))
+        else:
+            rows.append(models.AttemptAnswer(attempt_id=quiz_taker.pk, question_id=item.question.pk,
+                                             answer_id=item.your_answer.pk, correct=item.correct))
+    return rows
+
+
+@retry_on_lock
+def save_result(quiz_taker, result):
+    '''Stores a graded submission, counting the quiz as taken on first completion'''
+    rows = attempt_answers(quiz_taker, result)
+    with transaction.atomic():
+        attempts = models.QuizTaker.objects.filter(pk=quiz_taker.pk)
+        first_completion = attempts.filter(completed=False).update(
+            correct_answers=result.correct_answers,
+            completed=True,
+        )
+        if first_completion:
+            models.Quiz.objects.filter(pk=quiz_taker.quiz_id).update(times_taken=F('times_taken') + 1)
+        else:
+            attempts.update(correct_answers=result.correct_answers)
+            previous = models.AttemptAnswer.objects.filter(attempt_id=quiz_taker.pk)
+            record_responses(list(previous.only('question_id', 'answer_id', 'correct')), delta=-1)
+            previous.delete()
+        models.AttemptAnswer.objects.bulk_create(rows)
+        record_responses(rows)
+    quiz_taker.correct_answers = result.correct_answers
+    quiz_taker.completed = True
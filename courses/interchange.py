@@ -0,0 +1,209 @@
+'''Moves whole quizzes in and out as JSON or CSV.
+
+JSON holds one object: {"format": 1, "quiz": {...}, "questions": [...]},
+each question carrying its own "answers" list. CSV has one row per answer
+(CSV_COLUMNS); rows sharing a "question" number belong to one question,
+a question without answers is a row with an empty answer_text, and the
+quiz title and description are supplied by the importer.'''
+import csv
+import io
+import json
+
+from django.db import transaction
+
+from . import models, question_types
+from .bulk import bulk_create_questions
+
+FORMAT_VERSION = 1
+CSV_COLUMNS = ['question', 'type', 'order', 'prompt', 'shuffle_answers', 'answer_order', 'answer_text', 'correct']
+EXPORT_CHUNK_SIZE = 200
+
+
+class QuizFormatError(ValueError):
+    '''The uploaded quiz could not be read'''
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def parse_int(value, name):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        raise QuizFormatError('{} must be a whole number, not {!r}'.format(name, value))
+
+
+def clean_question(data, number):
+    '''Validates one question dict, returning it with normalised values'''
+    if not isinstance(data, dict):
+        raise QuizFormatError('Question {} is not an object'.format(number))
+    question_type = str(data.get('type', '')).upper()
+    if question_type not in question_types.registry:
+        raise QuizFormatError('Question {} has unknown type {!r}, expected one of {}'.format(
+            number, data.get('type'), ', '.join(question_types.registry)))
+    prompt = str(data.get('prompt') or '').strip()
+    if not prompt:
+        raise QuizFormatError('Question {} has no prompt'.format(number))
+    answers = []
+    raw_answers = data.get('answers') or []
+    if not isinstance(raw_answers, list):
+        raise QuizFormatError('Question {} "answers" is not a list'.format(number))
+    for answer_number, answer in enumerate(raw_answers, start=1):
+        if not isinstance(answer, dict):
+            raise QuizFormatError('Question {} answer {} is not an object'.format(number, answer_number))
+        text = str(answer.get('text') or '').strip()
+        if not text or len(text) > 255:
+            raise QuizFormatError('Question {} has an answer that is empty or over 255 characters'.format(number))
+        answers.append({
+            'order': parse_int(answer.get('order'), 'Answer order'),
+            'text': text,
+            'correct': parse_bool(answer.get('correct', False)),
+        })
+    return {
+        'type': question_type,
+        'order': parse_int(data.get('order'), 'Question order'),
+        'prompt': prompt,
+        'shuffle_answers': parse_bool(data.get('shuffle_answers', False)),
+        'answers': answers,
+    }
+
+
+def read_json(file):
+    try:
+        data = json.load(file)
+    except ValueError as error:
+        raise QuizFormatError('Invalid JSON: {}'.format(error))
+    if not isinstance(data, dict) or data.get('format') != FORMAT_VERSION:
+        raise QuizFormatError('Expected a quiz export with "format": {}'.format(FORMAT_VERSION))
+    quiz = data.get('quiz') or {}
+    if not isinstance(quiz, dict):
+        raise QuizFormatError('"quiz" is not an object')
+    questions = data.get('questions') or []
+    if not isinstance(questions, list):
+        raise QuizFormatError('"questions" is not a list')
+    return {
+        'title': str(quiz.get('title') or '').strip(),
+        'description': str(quiz.get('description') or ''),
+        'order': parse_int(quiz.get('order'), 'Quiz order'),
+        'questions': [clean_question(question, number)
+                      for number, question in enumerate(questions, start=1)],
+    }
+
+
+def read_csv(file):
+    reader = csv.DictReader(file)
+    missing = set(CSV_COLUMNS) - set(reader.fieldnames or [])
+    if missing:
+        raise QuizFormatError('Missing columns: {}'.format(', '.join(sorted(missing))))
+    questions = {}
+    for row in reader:
+        question = questions.setdefault(row['question'], dict(row, answers=[]))
+        if row['answer_text']:
+            question['answers'].append({
+                'order': row['answer_order'],
+                'text': row['answer_text'],
+                'correct': row['correct'],
+            })
+    return {
+        'title': '',
+        'description': '',
+        'order': 0,
+        'questions': [clean_question(question, number)
+                      for number, question in enumerate(questions.values(), start=1)],
+    }
+
+
+def read_quiz(file, format):
+    '''Parses a text file in 'json' or 'csv' format'''
+    if format == 'json':
+        return read_json(file)
+    if format == 'csv':
+        return read_csv(file)
+    raise QuizFormatError('Unknown format {!r}'.format(format))
+
+
+def format_for(filename):
+    return 'csv' if filename.lower().endswith('.csv') else 'json'
+
+
+@transaction.atomic
+def import_quiz(course, data, batch_size=1000):
+    '''Creates a quiz on `course` from read_quiz() output with one bulk
+    insert per table'''
+    if not data['title']:
+        raise QuizFormatError('The quiz needs a title')
+    quiz = models.Quiz(course=course, title=data['title'][:255], description=data['description'],
+                       order=data['order'], total_questions=len(data['questions']))
+    quiz.save()
+
+    questions = []
+    for item in data['questions']:
+        model = question_types.get_type(item['type']).model
+        question = model(quiz_id=quiz.pk, order=item['order'], prompt=item['prompt'], question_type=item['type'])
+        if hasattr(question, 'shuffle_answers'):
+            question.shuffle_answers = item['shuffle_answers']
+        questions.append(question)
+    bulk_create_questions(questions, batch_size=batch_size)
+
+    models.Answer.objects.bulk_create([
+        models.Answer(question_id=question.pk, **answer)
+        for question, item in zip(questions, data['questions'])
+        for answer in item['answers']
+    ], batch_size=batch_size)
+    return quiz
+
+
+def export_questions(quiz):
+    '''Yields each question as a dict with its answers, loading a chunk of questions at a time'''
+    queryset = (question_types.with_subtypes(models.Question.objects.filter(quiz_id=quiz.pk))
+                .prefetch_related('answer_set')
+                .order_by('order', 'pk'))
+    for question in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'type': question.question_type,
+            'order': question.order,
+            'prompt': question.prompt,
+            'shuffle_answers': getattr(question_types.concrete(question), 'shuffle_answers', False),
+            'answers': [{'order': answer.order, 'text': answer.text, 'correct': answer.correct}
+                        for answer in question.answer_set.all()],
+        }
+
+
+def export_json(quiz):
+    '''Yields the quiz as JSON text, one question per chunk'''
+    header = json.dumps({'format': FORMAT_VERSION, 'quiz': {
+        'title': quiz.title,
+        'description': quiz.description,
+        'order': quiz.order,
+    }})
+    yield header[:-1] + ', "questions": ['
+    for number, question in enumerate(export_questions(quiz)):
+        yield (',\n' if number else '\n') + json.dumps(question)
+    yield '\n]}\n'
+
+
+def export_csv(quiz):
+    '''Yields the quiz as CSV text, one question's rows per chunk'''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    for number, question in enumerate(export_questions(quiz), start=1):
+        row = [number, question['type'], question['order'], question['prompt'], question['shuffle_answers']]
+        for answer in question['answers'] or [{'order': '', 'text': '', 'correct': ''}]:
+            writer.writerow(row + [answer['order'], answer['text'], answer['correct']])
+        yield flush()
+
+
+def export_quiz(quiz, format):
+    return export_csv(quiz) if format == 'csv' else export_json(quiz)
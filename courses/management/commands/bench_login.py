@@ -0,0 +1,110 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+PASSWORD = 'bench-login-password'
+
+
+class HashCounter:
+    '''Counts calls to the default hasher's encode(), which every verify and
+    every dummy hash for an unknown username goes through'''
+
+    def __init__(self):
+        self.hasher = type(get_hasher())
+        self.calls = 0
+
+    def __enter__(self):
+        original = self.original = self.hasher.encode
+
+        def encode(hasher, *args, **kwargs):
+            self.calls += 1
+            return original(hasher, *args, **kwargs)
+
+        self.hasher.encode = encode
+        return self
+
+    def __exit__(self, *exc_info):
+        self.hasher.encode = self.original
+
+
+class Command(BaseCommand):
+    help = ('Measures the cost of logging in through the login form: password hashes per login '
+            'and logins/sec per core with the configured PASSWORD_HASHERS')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20, help='Logins per process')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Concurrent login processes, one per core to measure scaling')
+        parser.add_argument('--username', default='bench-login',
+                            help='User created (or reset) for the benchmark')
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(username=options['username'])
+        user.password = make_password(PASSWORD)
+        user.is_active = True
+        user.save(update_fields=['password', 'is_active'])
+
+        with override_settings(ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'], PERF_LOG_FILE=None):
+            with HashCounter() as counter:
+                login(user.username)
+            hashes = counter.calls
+
+            if options['processes'] == 1:
+                elapsed = login_loop(user.username, options['logins'])
+                rates = [options['logins'] / elapsed]
+            else:
+                rates = self.run_processes(user.username, options)
+
+        self.stdout.write('hasher: {}'.format(get_hasher().algorithm))
+        self.stdout.write('hashes per login: {}'.format(hashes))
+        self.stdout.write('logins/sec: {:.1f} total, {:.1f} per core over {} process(es)'.format(
+            sum(rates), sum(rates) / len(rates), len(rates)))
+
+    def run_processes(self, username, options):
+        # forked processes, as hashing holds the GIL and threads would not scale
+        context = multiprocessing.get_context('fork')
+        connections.close_all()
+        queue = context.Queue()
+        barrier = context.Barrier(options['processes'])
+        workers = [
+            context.Process(target=timed_worker, args=(username, options['logins'], barrier, queue))
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        elapsed = [queue.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        if None in elapsed:
+            raise CommandError('A login process failed')
+        return [options['logins'] / seconds for seconds in elapsed]
+
+
+def login(username):
+    response = Client().post(reverse('login_view'), {'username': username, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError('Login failed with status {}'.format(response.status_code))
+
+
+def login_loop(username, logins):
+    start = time.perf_counter()
+    for _ in range(logins):
+        login(username)
+    return time.perf_counter() - start
+
+
+def timed_worker(username, logins, barrier, queue):
+    elapsed = None
+    try:
+        barrier.wait()
+        elapsed = login_loop(username, logins)
+    finally:
+        connections.close_all()
+        queue.put(elapsed)
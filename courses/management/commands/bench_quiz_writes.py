@@ -0,0 +1,107 @@
+import math
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from courses.grading import AnswerKey, save_result
+from courses.models import QuizTaker
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Measures quiz submission throughput as the number of concurrent writers grows. '
+            'Rewrites the answers of attempts made by seed_benchmark_data users.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', default='1,2,4,8,16',
+                            help='Comma separated numbers of concurrent writer processes to try')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds to run each level for')
+        parser.add_argument('--prefix', default='bench', help='Username prefix used by seed_benchmark_data')
+        parser.add_argument('--no-retry', action='store_true',
+                            help='Fail on the first "database is locked" instead of backing off')
+
+    def handle(self, *args, **options):
+        levels = [int(value) for value in options['writers'].split(',')]
+        # one attempt per user, so each writer rewrites its own rows
+        attempts = {}
+        queryset = QuizTaker.objects.filter(
+            user__username__startswith=options['prefix'] + '-user-', completed=True,
+        ).order_by('user_id', 'pk')
+        for attempt in queryset.iterator():
+            attempts.setdefault(attempt.user_id, attempt)
+            if len(attempts) == max(levels):
+                break
+        attempts = list(attempts.values())
+        if len(attempts) < max(levels):
+            raise CommandError('Need {} users with completed attempts, run seed_benchmark_data first'.format(
+                max(levels)))
+
+        results = {}
+        for attempt in attempts:
+            if attempt.quiz_id not in results:
+                key = AnswerKey.for_quiz(attempt.quiz_id)
+                results[attempt.quiz_id] = key.grade({
+                    str(question.pk): question.correct_answer.text if question.free_text
+                    else str(question.correct_answer.pk)
+                    for question in key if question.correct_answer is not None
+                })
+
+        submit = save_result.__wrapped__ if options['no_retry'] else save_result
+        self.stdout.write('database: {} ({}), profile: {}'.format(
+            connection.settings_dict['NAME'], connection.vendor, getattr(settings, 'DB_PROFILE', 'development')))
+        self.stdout.write('{:>8}{:>14}{:>10}{:>10}{:>10}'.format(
+            'writers', 'submits/s', 'p50 ms', 'p95 ms', 'failed'))
+        for writers in levels:
+            timings, failures = self.run_level(submit, attempts[:writers], results, options['duration'])
+            throughput = len(timings) / options['duration']
+            p50 = percentile(timings, 50) if timings else 0
+            p95 = percentile(timings, 95) if timings else 0
+            self.stdout.write('{:>8}{:>14.1f}{:>10.2f}{:>10.2f}{:>10}'.format(
+                writers, throughput, p50, p95, failures))
+
+    def run_level(self, submit, attempts, results, duration):
+        # forked processes stand in for web workers, each with its own connection
+        context = multiprocessing.get_context('fork')
+        connections.close_all()
+        queue = context.Queue()
+        barrier = context.Barrier(len(attempts))
+        workers = [
+            context.Process(target=write_loop, args=(submit, attempt, results[attempt.quiz_id],
+                                                     duration, barrier, queue))
+            for attempt in attempts
+        ]
+        for worker in workers:
+            worker.start()
+        timings, failures = [], 0
+        for _ in workers:
+            worker_timings, worker_failures = queue.get()
+            timings += worker_timings
+            failures += worker_failures
+        for worker in workers:
+            worker.join()
+        return timings, failures
+
+
+def write_loop(submit, attempt, result, duration, barrier, queue):
+    timings, failures = [], 0
+    try:
+        barrier.wait()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                submit(attempt, result)
+            except OperationalError:
+                failures += 1
+                continue
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        connection.close()
+        queue.put((timings, failures))
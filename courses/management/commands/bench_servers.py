@@ -0,0 +1,118 @@
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from courses.models import Course, Text
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Compares requests/sec and tail latency of the catalogue views under many concurrent '
+            'requests, through the WSGI handler with sync views and the ASGI handler with async views. '
+            'Run seed_benchmark_data first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=64, help='Requests in flight at once')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mode')
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'],
+                            help='Run a single mode in this process and print its result as JSON')
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            self.stdout.write(json.dumps(self.run_mode(options)))
+            return
+
+        self.stdout.write('{:>6}{:>12}{:>10}{:>10}{:>10}{:>8}'.format(
+            'mode', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+        for mode in ('wsgi', 'asgi'):
+            # each mode runs in a fresh process, as ASYNC_VIEWS is read when the URLconf loads
+            env = dict(os.environ, DJANGO_ASYNC_VIEWS='1' if mode == 'asgi' else '0')
+            output = subprocess.run(
+                [sys.executable, sys.argv[0], 'bench_servers', '--mode', mode,
+                 '--concurrency', str(options['concurrency']), '--requests', str(options['requests'])],
+                env=env, capture_output=True, text=True,
+            )
+            if output.returncode:
+                raise CommandError('{} run failed:\n{}'.format(mode, output.stderr))
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            self.stdout.write('{:>6}{requests_per_second:>12.1f}{p50_ms:>10.2f}{p95_ms:>10.2f}'
+                              '{p99_ms:>10.2f}{errors:>8}'.format(mode, **result))
+
+    def urls(self):
+        course = Course.objects.filter(published=True, step_count__gt=0).order_by('pk').first()
+        text = Text.objects.filter(course=course).order_by('pk').first() if course else None
+        if text is None:
+            raise CommandError('No published course with steps, run seed_benchmark_data first')
+        return [
+            reverse('courses:course list view'),
+            reverse('courses:course detail view', kwargs={'pk': course.pk}),
+            text.get_absolute_url(),
+            reverse('courses:by_teacher', kwargs={'teacher': course.teacher.username}),
+            reverse('courses:search') + '?q=energy',
+        ]
+
+    def run_mode(self, options):
+        urls = self.urls()
+        overrides = override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'],
+            PERF_LOG_FILE=None,
+        )
+        with overrides:
+            if options['mode'] == 'asgi':
+                timings, errors, elapsed = asyncio.run(self.run_asgi(urls, options))
+            else:
+                timings, errors, elapsed = self.run_wsgi(urls, options)
+        return {
+            'requests_per_second': len(timings) / elapsed,
+            'p50_ms': percentile(timings, 50),
+            'p95_ms': percentile(timings, 95),
+            'p99_ms': percentile(timings, 99),
+            'errors': errors,
+        }
+
+    def run_wsgi(self, urls, options):
+        # a threaded WSGI server: one thread per request in flight
+        def fetch(i):
+            client = Client()
+            start = time.perf_counter()
+            response = client.get(urls[i % len(urls)])
+            return (time.perf_counter() - start) * 1000, response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(fetch, range(options['requests'])))
+        elapsed = time.perf_counter() - start
+        return [ms for ms, status in results], sum(status >= 400 for ms, status in results), elapsed
+
+    async def run_asgi(self, urls, options):
+        # one event loop, with `concurrency` requests in flight
+        timings, errors = [], 0
+        pending = iter(range(options['requests']))
+
+        async def worker():
+            nonlocal errors
+            client = AsyncClient()
+            for i in pending:
+                start = time.perf_counter()
+                response = await client.get(urls[i % len(urls)])
+                timings.append((time.perf_counter() - start) * 1000)
+                errors += response.status_code >= 400
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(options['concurrency'])))
+        return timings, errors, time.perf_counter() - start
@@ -0,0 +1,228 @@
+import json
+import math
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import quote_etag
+
+from courses import question_types
+from courses.api import content_etag
+from courses.interchange import export_quiz
+from courses.models import Course, Question, QuizTaker, Text, VideoUpload
+from courses.pagination import encode_cursor
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'bench_views_baseline.json')
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Drives every site view through the test client against data from seed_benchmark_data, '
+            'reporting latency percentiles and query counts and failing on regressions against a baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per view')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per view, to fill caches')
+        parser.add_argument('--prefix', default='bench', help='Username prefix used by seed_benchmark_data')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed p50 slowdown over the baseline, as a fraction')
+        parser.add_argument('--slack', type=float, default=2.0,
+                            help='Allowed p50 slowdown over the baseline in ms, on top of --tolerance')
+        parser.add_argument('--write-baseline', action='store_true',
+                            help='Save this run as the new baseline instead of checking against it')
+        parser.add_argument('--no-check', action='store_true', help='Do not compare with the baseline')
+
+    def handle(self, *args, **options):
+        overrides = override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'],
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            PERF_LOG_FILE=None,
+        )
+        # everything the views write is rolled back once the run is over
+        with overrides, transaction.atomic():
+            results = self.run_cases(options)
+            transaction.set_rollback(True)
+
+        self.report(results)
+        if options['write_baseline']:
+            with open(options['baseline'], 'w') as f:
+                json.dump({'views': results}, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS('Wrote baseline to {}'.format(options['baseline'])))
+        elif not options['no_check'] and os.path.exists(options['baseline']):
+            self.check_baseline(results, options)
+
+    def fixtures(self, prefix):
+        staff = User.objects.filter(username__startswith=prefix + '-teacher-').order_by('pk').first()
+        attempt = QuizTaker.objects.filter(
+            user__username__startswith=prefix + '-user-', completed=True, quiz__course__published=True,
+        ).select_related('user', 'quiz').order_by('pk').first()
+        if staff is None or attempt is None:
+            raise CommandError('No benchmark data found, run seed_benchmark_data first')
+        quiz = attempt.quiz
+        course = Course.objects.get(pk=quiz.course_id)
+        text = Text.objects.filter(course=course).order_by('pk').first()
+        question = Question.objects.filter(quiz=quiz).order_by('order', 'pk').first()
+        if text is None or question is None:
+            raise CommandError('The benchmark course needs text steps and quiz questions')
+        return staff, attempt.user, course, text, quiz, question
+
+    def cases(self, prefix):
+        '''Yields (label, client role, method, url, data[, client kwargs]) for every
+        view worth timing. data may be a callable, run untimed before each
+        request, that returns the data; it prepares requests that use up their
+        state, such as a logout or an uploaded file.'''
+        staff, student, course, text, quiz, question = self.fixtures(prefix)
+        self.clients = {'anonymous': Client(), 'student': Client(), 'staff': Client(), 'leaving': Client()}
+        self.clients['student'].force_login(student)
+        self.clients['staff'].force_login(staff)
+
+        def log_in_leaving_student():
+            self.clients['leaving'].force_login(student)
+
+        exported = ''.join(export_quiz(quiz, 'json')).encode()
+
+        def quiz_file():
+            return {'file': SimpleUploadedFile('quiz.json', exported, 'application/json'), 'title': 'Imported'}
+
+        second_page = Course.objects.filter(published=True).order_by('pk').values_list('pk', flat=True)[19:20]
+        answers = {}
+        for item in Question.objects.filter(quiz=quiz).prefetch_related('answer_set'):
+            right = [answer for answer in item.answer_set.all() if answer.correct]
+            if right:
+                free_text = question_types.get_type(item.question_type).free_text
+                answers[str(item.pk)] = right[0].text if free_text else str(right[0].pk)
+
+        yield 'home view', 'anonymous', 'get', reverse('home view'), None
+        yield 'suggestion view', 'anonymous', 'get', reverse('suggestion view'), None
+        yield 'login_view', 'anonymous', 'get', reverse('login_view'), None
+        yield 'register_view', 'anonymous', 'get', reverse('register_view'), None
+        yield 'profile_view', 'student', 'get', reverse('profile_view'), None
+        yield 'logout_view', 'leaving', 'get', reverse('logout_view'), log_in_leaving_student
+        yield 'courses:course list view', 'anonymous', 'get', reverse('courses:course list view'), None
+        if second_page:
+            yield ('courses:course list view (page 2)', 'anonymous', 'get',
+                   reverse('courses:course list view'), {'after': encode_cursor(second_page)})
+        yield ('courses:course detail view', 'anonymous', 'get',
+               reverse('courses:course detail view', kwargs={'pk': course.pk}), None)
+        yield 'courses:text detail view', 'anonymous', 'get', text.get_absolute_url(), None
+        video = Text.objects.filter(course__published=True).exclude(video_file='').exclude(video_file=None).first()
+        if video is not None:
+            yield ('courses:step video', 'anonymous', 'get', reverse('courses:step video', kwargs={
+                'course_pk': video.course_id, 'step_pk': video.pk}), None)
+        yield 'courses:quiz detail view', 'student', 'get', quiz.get_absolute_url(), None
+        # the take/retake form posts back to the quiz page; the submit below completes the new attempt
+        yield ('courses:quiz detail view (retake)', 'student', 'post', quiz.get_absolute_url(),
+               {'quiz_take_or_retake': 'retake_quiz'})
+        yield ('courses:create_quiz', 'staff', 'get',
+               reverse('courses:create_quiz', kwargs={'course_pk': course.pk}), None)
+        yield ('courses:edit_quiz', 'staff', 'get',
+               reverse('courses:edit_quiz', kwargs={'course_pk': course.pk, 'quiz_pk': quiz.pk}), None)
+        yield ('courses:create_question', 'staff', 'get',
+               reverse('courses:create_question', kwargs={'quiz_pk': quiz.pk, 'question_type': 'mc'}), None)
+        yield ('courses:edit_question', 'staff', 'get',
+               reverse('courses:edit_question', kwargs={'quiz_pk': quiz.pk, 'question_pk': question.pk}), None)
+        yield ('courses:create_answer', 'staff', 'get',
+               reverse('courses:create_answer', kwargs={'question_pk': question.pk}), None)
+        yield ('courses:by_teacher', 'anonymous', 'get',
+               reverse('courses:by_teacher', kwargs={'teacher': course.teacher.username}), None)
+        yield 'courses:search', 'anonymous', 'get', reverse('courses:search'), {'q': 'energy wave'}
+        yield ('courses:take_questions', 'student', 'get',
+               reverse('courses:take_questions', kwargs={'quiz_pk': quiz.pk}), None)
+        yield ('courses:take_questions (submit)', 'student', 'post',
+               reverse('courses:take_questions', kwargs={'quiz_pk': quiz.pk}), answers)
+        yield ('courses:quiz_result', 'student', 'get',
+               reverse('courses:quiz_result', kwargs={'username': student.username, 'quiz_pk': quiz.pk}), None)
+        yield ('courses:quiz_statistics', 'staff', 'get',
+               reverse('courses:quiz_statistics', kwargs={'quiz_pk': quiz.pk}), None)
+        # the client-rendered quiz: one page, then JSON with gzip as a browser would ask for it
+        gzip = {'headers': {'Accept-Encoding': 'gzip'}}
+        content_url = reverse('courses:api_quiz_content', kwargs={'quiz_pk': quiz.pk})
+        yield 'courses:quiz_app', 'student', 'get', reverse('courses:quiz_app', kwargs={'quiz_pk': quiz.pk}), None
+        yield 'courses:api_quiz_content', 'student', 'get', content_url, None, gzip
+        yield ('courses:api_quiz_content (not modified)', 'student', 'get', content_url, None,
+               {'headers': {'If-None-Match': quote_etag(content_etag(None, quiz.pk))}})
+        yield ('courses:api_quiz_attempt', 'student', 'post',
+               reverse('courses:api_quiz_attempt', kwargs={'quiz_pk': quiz.pk}), {},
+               {'content_type': 'application/json'})
+        yield ('courses:api_quiz_submit', 'student', 'post',
+               reverse('courses:api_quiz_submit', kwargs={'quiz_pk': quiz.pk}), {'answers': answers},
+               dict(gzip, content_type='application/json'))
+        export_url = reverse('courses:export_quiz', kwargs={'course_pk': course.pk, 'quiz_pk': quiz.pk})
+        yield 'courses:export_quiz (json)', 'staff', 'get', export_url, None
+        yield 'courses:export_quiz (csv)', 'staff', 'get', export_url, {'format': 'csv'}
+        yield ('courses:import_quiz', 'staff', 'post',
+               reverse('courses:import_quiz', kwargs={'course_pk': course.pk}), quiz_file)
+        yield ('courses:video_upload_create', 'staff', 'post', reverse('courses:video_upload_create'),
+               {'step': text.pk, 'filename': 'lecture.mp4', 'size': 2 ** 20})
+        upload = VideoUpload.objects.create(step=text, user=staff, filename='lecture.mp4', size=2 ** 20)
+        yield ('courses:video_upload_detail', 'staff', 'get',
+               reverse('courses:video_upload_detail', kwargs={'upload_pk': upload.pk}), None)
+
+    def run_cases(self, options):
+        results = {}
+        for label, role, method, url, data, *kwargs in self.cases(options['prefix']):
+            request = getattr(self.clients[role], method)
+            kwargs = kwargs[0] if kwargs else {}
+            timings = []
+            for i in range(options['warmup'] + options['iterations']):
+                request_data = data() if callable(data) else data
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = request(url, request_data, **kwargs)
+                    if response.streaming:
+                        # streamed bodies are produced while they are read
+                        body = b''.join(response.streaming_content)
+                    else:
+                        body = response.content
+                    elapsed = (time.perf_counter() - start) * 1000
+                if i >= options['warmup']:
+                    timings.append(elapsed)
+            if response.status_code >= 400:
+                raise CommandError('{} answered {}'.format(label, response.status_code))
+            results[label] = {'queries': len(queries), 'bytes': len(body)}
+            results[label].update(('p{}_ms'.format(p), round(percentile(timings, p), 2)) for p in PERCENTILES)
+        return results
+
+    def report(self, results):
+        self.stdout.write('{:<44}{:>10}{:>10}{:>10}{:>10}{:>10}'.format(
+            'view', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'bytes'))
+        for label, result in results.items():
+            self.stdout.write('{:<44}{p50_ms:>10.2f}{p95_ms:>10.2f}{p99_ms:>10.2f}{queries:>10}{bytes:>10}'.format(
+                label, **result))
+
+    def check_baseline(self, results, options):
+        with open(options['baseline']) as f:
+            baseline = json.load(f)['views']
+        failures = []
+        for label, result in results.items():
+            expected = baseline.get(label)
+            if expected is None:
+                continue
+            if result['queries'] > expected['queries']:
+                failures.append('{}: {} queries, baseline {}'.format(label, result['queries'], expected['queries']))
+            if result['bytes'] > expected.get('bytes', result['bytes']) * (1 + options['tolerance']):
+                failures.append('{}: {} bytes, baseline {}'.format(label, result['bytes'], expected['bytes']))
+            # the median, as the tail of a short run is mostly scheduler and GC noise
+            limit = expected['p50_ms'] * (1 + options['tolerance']) + options['slack']
+            if result['p50_ms'] > limit:
+                failures.append('{}: p50 {:.2f} ms, baseline {:.2f} ms'.format(
+                    label, result['p50_ms'], expected['p50_ms']))
+        if failures:
+            raise CommandError('Regressions against {}:\n  {}'.format(options['baseline'], '\n  '.join(failures)))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from courses.uploads import remove_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Deletes video uploads that have not received a chunk recently'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24,
+                            help='Age in hours after which an untouched upload is stale')
+
+    def handle(self, *args, **options):
+        removed = remove_stale_uploads(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS('Removed {} stale uploads'.format(removed)))
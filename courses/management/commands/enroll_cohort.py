@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.enrollment import COHORT_FIELDS, enroll, read_cohort
+
+
+class Command(BaseCommand):
+    help = ('Creates student accounts from a CSV file with the columns {}. Passwords are hashed '
+            'in parallel and users are inserted in batches.'.format(', '.join(COHORT_FIELDS)))
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path of the cohort CSV')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users per INSERT')
+        parser.add_argument('--processes', type=int,
+                            help='Password hashing processes, defaults to one per core')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='Enroll the valid rows even if some rows are rejected')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as file:
+                users, errors = read_cohort(file)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        for line, message in errors:
+            self.stderr.write('Line {}: {}'.format(line, message))
+        if errors and not options['skip_invalid']:
+            raise CommandError('{} invalid rows, nothing was enrolled. Fix them or pass --skip-invalid'.format(
+                len(errors)))
+
+        start = time.perf_counter()
+        enroll(users, batch_size=options['batch_size'], processes=options['processes'])
+        self.stdout.write(self.style.SUCCESS('Enrolled {} users in {:.1f}s, skipped {} rows'.format(
+            len(users), time.perf_counter() - start, len(errors))))
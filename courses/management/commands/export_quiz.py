@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses import interchange
+from courses.models import Quiz
+
+
+class Command(BaseCommand):
+    help = 'Writes a quiz, its questions and answers as JSON or CSV for import_quiz'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_pk', type=int)
+        parser.add_argument('--format', choices=['json', 'csv'], default='json')
+        parser.add_argument('--output', help='File to write, standard output by default')
+
+    def handle(self, *args, **options):
+        try:
+            quiz = Quiz.objects.get(pk=options['quiz_pk'])
+        except Quiz.DoesNotExist:
+            raise CommandError('Quiz {} does not exist'.format(options['quiz_pk']))
+
+        chunks = interchange.export_quiz(quiz, options['format'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as file:
+                file.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
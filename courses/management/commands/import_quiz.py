@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from courses import interchange
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Creates a quiz, its questions and answers from a JSON or CSV file made by export_quiz'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_pk', type=int, help='Course the quiz is added to')
+        parser.add_argument('file', help='Path of the .json or .csv file')
+        parser.add_argument('--format', choices=['json', 'csv'],
+                            help='File format, guessed from the extension by default')
+        parser.add_argument('--title', help='Quiz title, required for CSV files')
+        parser.add_argument('--description', help='Quiz description')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.get(pk=options['course_pk'])
+        except Course.DoesNotExist:
+            raise CommandError('Course {} does not exist'.format(options['course_pk']))
+
+        format = options['format'] or interchange.format_for(options['file'])
+        try:
+            with open(options['file'], newline='', encoding='utf-8-sig') as file:
+                data = interchange.read_quiz(file, format)
+            data['title'] = options['title'] or data['title']
+            data['description'] = options['description'] or data['description']
+            with CaptureQueriesContext(connection) as queries:
+                quiz = interchange.import_quiz(course, data, batch_size=options['batch_size'])
+        except (OSError, interchange.QuizFormatError) as error:
+            raise CommandError(error)
+
+        self.stdout.write(self.style.SUCCESS('Imported quiz {} "{}" with {} questions in {} queries'.format(
+            quiz.pk, quiz.title, quiz.total_questions, len(queries))))
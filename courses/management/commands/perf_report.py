@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from learning_site.instrumentation import METRICS, read_log
+
+
+PERCENTILES = (50, 95, 99)
+
+
+class Command(BaseCommand):
+    help = 'Summarises the per-view request stats written by the instrumentation middleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=getattr(settings, 'PERF_LOG_FILE', None),
+                            help='JSON-lines stats file (defaults to PERF_LOG_FILE)')
+        parser.add_argument('--since', type=float, default=None,
+                            help='Only include stats flushed in the last this many hours')
+        parser.add_argument('--sort', choices=METRICS, default='total_ms',
+                            help='Order views by the p95 of this metric, slowest first')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        if not path:
+            raise CommandError('No stats file given and PERF_LOG_FILE is not set')
+        since = None
+        if options['since'] is not None:
+            since = time.time() - options['since'] * 3600
+        try:
+            views = read_log(path, since)
+        except FileNotFoundError:
+            raise CommandError('{} does not exist yet'.format(path))
+        if not views:
+            self.stdout.write('No requests recorded')
+            return
+
+        def sort_key(item):
+            histogram = item[1].get(options['sort'])
+            return -(histogram.percentile(95) if histogram else 0)
+
+        header = '{:<14}{:>12}{:>12}{:>12}'.format('', *('p{}'.format(p) for p in PERCENTILES))
+        for view, histograms in sorted(views.items(), key=sort_key):
+            requests = histograms['total_ms'].count if 'total_ms' in histograms else 0
+            self.stdout.write(self.style.MIGRATE_HEADING('{} ({} requests)'.format(view, requests)))
+            self.stdout.write(header)
+            for metric in METRICS:
+                if metric not in histograms:
+                    continue
+                values = [histograms[metric].percentile(p) for p in PERCENTILES]
+                self.stdout.write('{:<14}{:>12.1f}{:>12.1f}{:>12.1f}'.format(metric, *values))
+            self.stdout.write('')
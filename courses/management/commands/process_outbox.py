@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.outbox import deliver_batch
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued outbox emails in batches, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of messages sent per backend connection')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new messages instead of exiting when the outbox is empty')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to wait between polls of an empty outbox with --loop')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            try:
+                sent, failed = deliver_batch(options['batch_size'])
+            except Exception as error:
+                # e.g. the mail server refused the connection; the leased batch is retried later
+                if not options['loop']:
+                    raise
+                self.stderr.write('Delivery failed: {}'.format(error))
+                sent = failed = 0
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Sent {} messages, {} failed'.format(total_sent, total_failed)))
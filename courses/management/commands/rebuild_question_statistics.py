@@ -0,0 +1,44 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from courses.models import AnswerStatistic, AttemptAnswer, QuestionStatistic
+
+
+class Command(BaseCommand):
+    help = 'Recomputes question and answer statistics from stored attempt answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Number of attempt answers read and statistics written per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        responses, correct, chosen = Counter(), Counter(), Counter()
+
+        rows = AttemptAnswer.objects.filter(attempt__completed=True).values_list(
+            'question_id', 'answer_id', 'correct',
+        )
+        for question_id, answer_id, is_correct in rows.iterator(chunk_size=batch_size):
+            responses[question_id] += 1
+            if is_correct:
+                correct[question_id] += 1
+            if answer_id is not None:
+                chosen[answer_id] += 1
+
+        with transaction.atomic():
+            QuestionStatistic.objects.all().delete()
+            AnswerStatistic.objects.all().delete()
+            QuestionStatistic.objects.bulk_create(
+                (QuestionStatistic(question_id=pk, responses=total, correct=correct[pk])
+                 for pk, total in responses.items()),
+                batch_size=batch_size,
+            )
+            AnswerStatistic.objects.bulk_create(
+                (AnswerStatistic(answer_id=pk, chosen=total) for pk, total in chosen.items()),
+                batch_size=batch_size,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt statistics for {} questions and {} answers'.format(len(responses), len(chosen))))
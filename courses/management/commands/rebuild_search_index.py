@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.search import rebuild_search_index, search_available
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the SQLite FTS5 index of courses and text steps'
+
+    def handle(self, *args, **options):
+        if not search_available():
+            raise CommandError('Full-text search needs the SQLite database backend')
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from courses.models import Question, Quiz, QuizTaker
+from courses.payload import invalidate_quiz_payload
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Quiz.total_questions and Quiz.times_taken from stored questions and attempts'
+
+    def handle(self, *args, **options):
+        total_questions = dict(
+            Question.objects.values_list('quiz').annotate(total=Count('id')).order_by()
+        )
+        times_taken = dict(
+            QuizTaker.objects.filter(completed=True).values_list('quiz').annotate(total=Count('id')).order_by()
+        )
+
+        with transaction.atomic():
+            changed = []
+            for quiz in Quiz.objects.only('id', 'total_questions', 'times_taken'):
+                counters = (total_questions.get(quiz.pk, 0), times_taken.get(quiz.pk, 0))
+                if (quiz.total_questions, quiz.times_taken) != counters:
+                    quiz.total_questions, quiz.times_taken = counters
+                    changed.append(quiz)
+            Quiz.objects.bulk_update(changed, ['total_questions', 'times_taken'], batch_size=500)
+        for quiz in changed:
+            invalidate_quiz_payload(quiz.pk)
+
+        self.stdout.write(self.style.SUCCESS('Updated {} quizzes'.format(len(changed))))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from courses.models import Course, Quiz, Text
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Course.step_count from the Text and Quiz tables'
+
+    def handle(self, *args, **options):
+        counts = {}
+        for model in (Text, Quiz):
+            for course_id, total in model.objects.values_list('course').annotate(total=Count('id')).order_by():
+                counts[course_id] = counts.get(course_id, 0) + total
+
+        with transaction.atomic():
+            changed = []
+            for course in Course.objects.only('id', 'step_count'):
+                step_count = counts.get(course.pk, 0)
+                if course.step_count != step_count:
+                    course.step_count = step_count
+                    changed.append(course)
+            Course.objects.bulk_update(changed, ['step_count'], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS('Updated {} courses'.format(len(changed))))
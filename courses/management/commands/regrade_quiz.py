@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses import regrade
+from courses.models import Quiz
+
+
+class Command(BaseCommand):
+    help = ('Regrades the completed attempts of quizzes against their current answer key, '
+            'fixing stored scores after an Answer.correct flag or a user input answer was corrected')
+
+    def add_arguments(self, parser):
+        parser.add_argument('quiz_pk', nargs='*', type=int)
+        parser.add_argument('--all', action='store_true', help='Regrade every quiz')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Stored responses graded per pass')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            quiz_pks = list(Quiz.objects.order_by('pk').values_list('pk', flat=True))
+        elif options['quiz_pk']:
+            quiz_pks = options['quiz_pk']
+            missing = set(quiz_pks) - set(Quiz.objects.filter(pk__in=quiz_pks).values_list('pk', flat=True))
+            if missing:
+                raise CommandError('No quiz with id {}'.format(', '.join(map(str, sorted(missing)))))
+        else:
+            raise CommandError('Give quiz ids or --all')
+
+        engine = 'numpy' if regrade.np is not None else 'python'
+        for quiz_pk in quiz_pks:
+            start = time.perf_counter()
+            result = regrade.regrade_quiz(quiz_pk, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+            self.stdout.write(
+                'Quiz {}: {} attempts, {} responses, {} responses and {} scores {}changed in {:.2f}s ({})'.format(
+                    quiz_pk, result.attempts, result.responses, result.changed_responses, result.changed_scores,
+                    'would be ' if options['dry_run'] else '', time.perf_counter() - start, engine))
+            if result.skipped:
+                self.stdout.write('  skipped {} completed attempts without stored responses, '
+                                  'their scores are unchanged'.format(result.skipped))
@@ -0,0 +1,50 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from courses.models import Text
+from courses.rendering import content_hash, markdown_extras, render_markdown, rendered_cache
+
+
+class Command(BaseCommand):
+    help = 'Re-renders stored Text HTML in bulk, e.g. after MARKDOWN_EXTRAS changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of rendering processes')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of steps rendered and written per batch')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render steps whose stored hash is current')
+
+    def handle(self, *args, **options):
+        extras = markdown_extras()
+        render = partial(render_markdown, extras=extras)
+        batch_size = options['batch_size']
+        self.chunksize = max(1, batch_size // (4 * max(1, options['workers'] or 1)))
+        rows = Text.objects.order_by('pk').values_list('pk', 'content', 'content_hash')
+        rendered = 0
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            batch = []
+            for pk, content, stored_hash in rows.iterator(chunk_size=batch_size):
+                digest = content_hash(content, extras)
+                if options['force'] or digest != stored_hash:
+                    batch.append(Text(pk=pk, content=content, content_hash=digest))
+                if len(batch) >= batch_size:
+                    rendered += self.render_batch(pool, render, batch)
+                    batch = []
+            if batch:
+                rendered += self.render_batch(pool, render, batch)
+
+        rendered_cache.clear()
+        self.stdout.write(self.style.SUCCESS('Rendered {} steps'.format(rendered)))
+
+    def render_batch(self, pool, render, batch):
+        contents = [text.content for text in batch]
+        for text, html in zip(batch, pool.map(render, contents, chunksize=self.chunksize)):
+            text.content_html = html
+        Text.objects.bulk_update(batch, ['content_html', 'content_hash'])
+        return len(batch)
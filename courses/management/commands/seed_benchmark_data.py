@@ -0,0 +1,204 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from courses import question_types
+from courses.bulk import bulk_create_questions
+from courses.catalogue import invalidate_catalogue
+from courses.models import (Answer, AttemptAnswer, Course, MultipleChoiceQuestion, Quiz, QuizTaker,
+                            Text, TrueFalseQuestion, UserInputQuestion)
+from courses.outline import invalidate_course_outline
+from courses.payload import invalidate_quiz_payload
+from courses.rendering import content_hash, render_markdown
+
+
+SUBJECTS = ['Mechanics', 'Optics', 'Thermodynamics', 'Electromagnetism', 'Quantum Physics']
+WORDS = ('energy momentum field wave particle charge photon entropy lattice orbit '
+         'spin vector tensor force mass current potential frequency').split()
+QUESTION_MODELS = {'MCQ': MultipleChoiceQuestion, 'TFQ': TrueFalseQuestion, 'UIQ': UserInputQuestion}
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with synthetic courses, quizzes, users and attempts for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=20)
+        parser.add_argument('--texts', type=int, default=5, help='Text steps per course')
+        parser.add_argument('--quizzes', type=int, default=2, help='Quizzes per course')
+        parser.add_argument('--questions', type=int, default=10, help='Questions per quiz')
+        parser.add_argument('--teachers', type=int, default=5)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--attempts', type=int, default=5, help='Completed quizzes per user')
+        parser.add_argument('--prefix', default='bench', help='Prefix of generated usernames')
+        parser.add_argument('--password', default='benchmark', help='Password of every generated user')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--replace', action='store_true',
+                            help='Delete users with the prefix, and their courses, first')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+
+        existing = User.objects.filter(username__startswith=prefix + '-')
+        if existing.exists():
+            if not options['replace']:
+                raise CommandError('Users named {}-* already exist, pass --replace to delete them'.format(prefix))
+            existing.delete()
+
+        with transaction.atomic():
+            teachers, students = self.create_users(options)
+            courses = self.create_courses(options, teachers)
+            self.create_texts(options, courses)
+            quizzes = self.create_quizzes(options, courses)
+            questions = self.create_questions(options, quizzes)
+            answers = self.create_answers(questions)
+            attempts = self.create_attempts(options, students, quizzes, questions, answers)
+
+        # bulk_create skips signals, so bring derived data up to date
+        for command in ('reconcile_quiz_counters', 'rebuild_question_statistics', 'rebuild_search_index'):
+            call_command(command, stdout=self.stdout)
+        invalidate_catalogue()
+        for course in courses:
+            invalidate_course_outline(course.pk)
+        for quiz in quizzes:
+            invalidate_quiz_payload(quiz.pk)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Created {} users, {} courses, {} quizzes, {} questions and {} attempts'.format(
+                len(teachers) + len(students), len(courses), len(quizzes), len(questions), attempts)))
+
+    def words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def create_users(self, options):
+        # hashing is deliberately slow, and every generated user shares a password
+        password = make_password(options['password'])
+        prefix = options['prefix']
+        teachers = [
+            User(username='{}-teacher-{}'.format(prefix, i), password=password, is_staff=True)
+            for i in range(options['teachers'])
+        ]
+        students = [
+            User(username='{}-user-{}'.format(prefix, i), password=password,
+                 email='{}-user-{}@example.com'.format(prefix, i))
+            for i in range(options['users'])
+        ]
+        User.objects.bulk_create(teachers + students, batch_size=self.batch_size)
+        return teachers, students
+
+    def create_courses(self, options, teachers):
+        if not teachers:
+            raise CommandError('At least one teacher is needed to own the courses')
+        courses = [
+            Course(
+                title='{} {}'.format(self.rng.choice(SUBJECTS), i),
+                description=self.words(40),
+                teacher=teachers[i % len(teachers)],
+                subject=self.rng.choice(SUBJECTS),
+                course_length='{} weeks'.format(self.rng.randint(2, 12)),
+                # a few drafts, as in a real catalogue
+                published=i % 10 != 9,
+                step_count=options['texts'] + options['quizzes'],
+            )
+            for i in range(options['courses'])
+        ]
+        return Course.objects.bulk_create(courses, batch_size=self.batch_size)
+
+    def create_texts(self, options, courses):
+        texts = []
+        for course in courses:
+            for order in range(options['texts']):
+                content = '## {}\n\n{}\n\n* {}\n* {}\n'.format(
+                    self.words(3), self.words(300), self.words(8), self.words(8))
+                texts.append(Text(
+                    course=course, order=order * 2, title=self.words(4).title(),
+                    description=self.words(20), content=content,
+                    content_html=render_markdown(content), content_hash=content_hash(content),
+                ))
+        Text.objects.bulk_create(texts, batch_size=self.batch_size)
+
+    def create_quizzes(self, options, courses):
+        quizzes = [
+            Quiz(course=course, order=order * 2 + 1, title='Quiz: {}'.format(self.words(3)),
+                 description=self.words(20), total_questions=options['questions'])
+            for course in courses
+            for order in range(options['quizzes'])
+        ]
+        return Quiz.objects.bulk_create(quizzes, batch_size=self.batch_size)
+
+    def create_questions(self, options, quizzes):
+        questions = []
+        for quiz in quizzes:
+            for order in range(options['questions']):
+                question_type = self.rng.choice(list(QUESTION_MODELS))
+                questions.append(QUESTION_MODELS[question_type](
+                    quiz=quiz, order=order, prompt='{}?'.format(self.words(12)),
+                    question_type=question_type,
+                ))
+        return bulk_create_questions(questions, self.batch_size)
+
+    def create_answers(self, questions):
+        answers = []
+        for question in questions:
+            if question.question_type == 'MCQ':
+                right = self.rng.randrange(4)
+                choices = [(self.words(3), i == right) for i in range(4)]
+            elif question.question_type == 'TFQ':
+                right = self.rng.random() < 0.5
+                choices = [('True', right), ('False', not right)]
+            else:
+                choices = [(str(self.rng.randint(1, 1000)), True)]
+            answers += [
+                Answer(question=question, order=order, text=text, correct=correct)
+                for order, (text, correct) in enumerate(choices)
+            ]
+        Answer.objects.bulk_create(answers, batch_size=self.batch_size)
+
+        by_question = {}
+        for answer in answers:
+            by_question.setdefault(answer.question_id, []).append(answer)
+        return by_question
+
+    def create_attempts(self, options, students, quizzes, questions, answers):
+        by_quiz = {}
+        for question in questions:
+            by_quiz.setdefault(question.quiz_id, []).append(question)
+
+        attempts, picked = [], []
+        for student in students:
+            for quiz in self.rng.sample(quizzes, min(options['attempts'], len(quizzes))):
+                attempts.append(QuizTaker(user=student, quiz=quiz, completed=True))
+                picked.append(by_quiz.get(quiz.pk, []))
+        QuizTaker.objects.bulk_create(attempts, batch_size=self.batch_size)
+
+        rows = []
+        for attempt, quiz_questions in zip(attempts, picked):
+            for question in quiz_questions:
+                free_text = question_types.get_type(question.question_type).free_text
+                choices = answers[question.pk]
+                right = [answer for answer in choices if answer.correct][0]
+                if self.rng.random() < 0.6:
+                    chosen = right
+                elif free_text:
+                    chosen = None
+                else:
+                    chosen = self.rng.choice([answer for answer in choices if not answer.correct])
+                correct = chosen is right
+                if free_text:
+                    text = right.text if correct else str(self.rng.randint(1001, 2000))
+                    rows.append(AttemptAnswer(attempt=attempt, question=question, text=text, correct=correct))
+                else:
+                    rows.append(AttemptAnswer(attempt=attempt, question=question, answer=chosen, correct=correct))
+                attempt.correct_answers += correct
+            if len(rows) >= self.batch_size:
+                AttemptAnswer.objects.bulk_create(rows, batch_size=self.batch_size)
+                rows = []
+        AttemptAnswer.objects.bulk_create(rows, batch_size=self.batch_size)
+        QuizTaker.objects.bulk_update(attempts, ['correct_answers'], batch_size=self.batch_size)
+        return len(attempts)
@@ -1,8 +1,14 @@
+import uuid
+
 from django.urls import reverse
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 
 from django.contrib.auth.models import User
 
+from .rendering import content_hash, render_markdown
+
 # Create your models here.
 class Course(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -12,10 +18,28 @@ class Course(models.Model):
     subject = models.CharField(default='', max_length=100)
     course_length = models.CharField(default='', max_length=100)
     published = models.BooleanField(default=False)
+    # number of Text and Quiz steps, kept up to date as steps are added and removed
+    step_count = models.IntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['published', 'id']),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so a save can tell whether the public catalogue changed
+        instance._loaded_listing = instance.listing()
+        return instance
+
+    def listing(self):
+        '''The fields shown in catalogue listings'''
+        return self.__dict__.get('published'), self.__dict__.get('title')
+
 
 class Step(models.Model):
     title = models.CharField(max_length=255)
@@ -30,12 +54,22 @@ class Step(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Course.objects.filter(pk=self.course_id).update(step_count=F('step_count') + 1)
+
 
 class Text(Step):
     # Text class inheritance of Step
     video_name = models.CharField(blank=True, max_length=500, default='')
     video_file = models.FileField(blank=True, upload_to='videos/', null=True, verbose_name="")
     content = models.TextField(blank=True, default='')
+    # content rendered to HTML on save, along with the hash it was rendered from
+    content_html = models.TextField(blank=True, default='', editable=False)
+    content_hash = models.CharField(blank=True, max_length=40, default='', editable=False)
 
     def get_absolute_url(self):
         return reverse('courses:text detail view', kwargs={
@@ -43,6 +77,38 @@ class Text(Step):
                        'step_pk': self.id,
                        })
 
+    def render_content(self):
+        '''Re-renders content_html if the content or markdown extras changed'''
+        digest = content_hash(self.content)
+        if digest != self.content_hash:
+            self.content_html = render_markdown(self.content)
+            self.content_hash = digest
+            return True
+        return False
+
+    def save(self, *args, **kwargs):
+        if self.render_content() and kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'content_html', 'content_hash'}
+        super().save(*args, **kwargs)
+
+
+# VideoUpload class
+class VideoUpload(models.Model):
+    # resumable chunked upload of a lecture video for a Text step
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    step = models.ForeignKey(Text, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)  # bytes received so far
+    checksum = models.CharField(blank=True, max_length=64, default='')  # expected SHA-256 of the whole file
+    completed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.filename
+
 
 class Quiz(Step):
     # Quiz class inheritance of Step
@@ -122,9 +188,55 @@ class QuizTaker(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
     correct_answers = models.IntegerField(default=0)
-    your_answers = dict()  # dictionary with user answers as keys and correctness as values
     completed = models.BooleanField(default=False)
     time_stamp = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.user.username + ' quiz_id: ' + str(self.quiz.id)
+
+
+# AttemptAnswer class
+class AttemptAnswer(models.Model):
+    # one submitted answer of a QuizTaker attempt
+    attempt = models.ForeignKey(QuizTaker, on_delete=models.CASCADE)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    answer = models.ForeignKey(Answer, on_delete=models.SET_NULL, blank=True, null=True)  # chosen answer
+    text = models.TextField(blank=True, default='')  # user input answer, stored as graded
+    correct = models.BooleanField(default=False)
+
+    def __str__(self):
+        return self.text or str(self.answer)
+
+
+# Item analysis statistics, maintained incrementally as attempts are graded
+class QuestionStatistic(models.Model):
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True)
+    responses = models.IntegerField(default=0)
+    correct = models.IntegerField(default=0)
+
+
+class AnswerStatistic(models.Model):
+    answer = models.OneToOneField(Answer, on_delete=models.CASCADE, primary_key=True)
+    chosen = models.IntegerField(default=0)
+
+
+# OutboxMessage class
+class OutboxMessage(models.Model):
+    # an email queued by a request and delivered by `manage.py process_outbox`
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.TextField()  # one address per line
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, null=True, blank=True)  # null once given up
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sent_at', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return self.subject
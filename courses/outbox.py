@@ -0,0 +1,74 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import models
+
+
+def enqueue_mail(subject, body, from_email, recipient_list):
+    '''Queues an email for process_outbox; the caller only pays for one INSERT'''
+    return models.OutboxMessage.objects.create(
+        subject=subject[:255],
+        body=body,
+        from_email=from_email,
+        recipients='\n'.join(recipient_list),
+    )
+
+
+def retry_delay(attempts):
+    '''Exponential backoff with jitter, from OUTBOX_RETRY_BACKOFF seconds up to an hour'''
+    base = getattr(settings, 'OUTBOX_RETRY_BACKOFF', 30)
+    delay = min(base * 2 ** (attempts - 1), 60 * 60)
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def claim_batch(batch_size):
+    '''Leases up to `batch_size` due messages, so concurrent workers skip them'''
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'OUTBOX_LEASE', 300))
+    with transaction.atomic():
+        due = models.OutboxMessage.objects.filter(sent_at=None, next_attempt_at__lte=now)
+        messages = list(due.order_by('next_attempt_at', 'pk')[:batch_size])
+        models.OutboxMessage.objects.filter(pk__in=[message.pk for message in messages]).update(
+            next_attempt_at=now + lease,
+        )
+    return messages
+
+
+def deliver_batch(batch_size=100):
+    '''Sends one batch of due messages over a single backend connection.
+
+    Failed messages are rescheduled with backoff until OUTBOX_MAX_ATTEMPTS,
+    after which they are left unsent with next_attempt_at cleared.
+    Returns (sent, failed).'''
+    messages = claim_batch(batch_size)
+    if not messages:
+        return 0, 0
+
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+    sent, failed = [], []
+    with get_connection() as connection:
+        for message in messages:
+            email = EmailMessage(message.subject, message.body, message.from_email,
+                                 message.recipients.splitlines(), connection=connection)
+            try:
+                email.send()
+            except Exception as error:
+                message.attempts += 1
+                message.last_error = '{}: {}'.format(type(error).__name__, error)
+                message.next_attempt_at = None
+                if message.attempts < max_attempts:
+                    message.next_attempt_at = timezone.now() + retry_delay(message.attempts)
+                failed.append(message)
+            else:
+                message.attempts += 1
+                message.sent_at = timezone.now()
+                sent.append(message)
+
+    models.OutboxMessage.objects.bulk_update(sent, ['attempts', 'sent_at'])
+    models.OutboxMessage.objects.bulk_update(failed, ['attempts', 'last_error', 'next_attempt_at'])
+    return len(sent), len(failed)
@@ -0,0 +1,116 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+
+from . import models
+from .caching import aget_version, bump_version, get_version
+
+
+OUTLINE_CACHE_TIMEOUT = 60 * 60 * 24
+# name of the {% cache %} fragment in step_sidebar.html
+STEPS_FRAGMENT = 'step_sidebar'
+
+# compact sidebar entry for a single step of a course
+OutlineEntry = namedtuple('OutlineEntry', ['kind', 'pk', 'title', 'order', 'url'])
+
+
+def content_version_key(course_pk):
+    return 'courses:content-version:{}'.format(course_pk)
+
+
+def course_content_version(course_pk):
+    '''Version of a course's step list, moved on whenever a step changes'''
+    return get_version(content_version_key(course_pk))
+
+
+async def acourse_content_version(course_pk):
+    return await aget_version(content_version_key(course_pk))
+
+
+def outline_cache_key(course_pk, version):
+    return 'courses:outline:{}:{}'.format(course_pk, version)
+
+
+# an outline together with the content version it was read at
+VersionedOutline = namedtuple('VersionedOutline', ['version', 'entries'])
+
+
+def outline_queries(course_pk):
+    texts = models.Text.objects.filter(course_id=course_pk).order_by('order', 'pk').values_list('pk', 'title', 'order')
+    quizzes = models.Quiz.objects.filter(course_id=course_pk).order_by('order', 'pk').values_list('pk', 'title', 'order')
+    return texts, quizzes
+
+
+def outline_entries(course_pk, texts, quizzes):
+    entries = [
+        OutlineEntry('text', pk, title, order, reverse('courses:text detail view', kwargs={
+            'course_pk': course_pk,
+            'step_pk': pk,
+        }))
+        for pk, title, order in texts
+    ]
+    entries += [
+        OutlineEntry('quiz', pk, title, order, reverse('courses:quiz detail view', kwargs={
+            'course_pk': course_pk,
+            'quiz_pk': pk,
+        }))
+        for pk, title, order in quizzes
+    ]
+    # stable sort keeps texts ahead of quizzes that share an order
+    entries.sort(key=lambda entry: entry.order)
+    return entries
+
+
+def build_course_outline(course_pk):
+    '''Builds the ordered list of steps for a course from the sidebar columns only'''
+    texts, quizzes = outline_queries(course_pk)
+    return outline_entries(course_pk, list(texts), list(quizzes))
+
+
+async def abuild_course_outline(course_pk):
+    texts, quizzes = outline_queries(course_pk)
+    return outline_entries(course_pk, [row async for row in texts], [row async for row in quizzes])
+
+
+def get_course_outline(course_pk):
+    '''Returns the cached outline for a course, building it on a miss'''
+    key = outline_cache_key(course_pk, course_content_version(course_pk))
+    outline = cache.get(key)
+    if outline is None:
+        outline = build_course_outline(course_pk)
+        cache.set(key, outline, OUTLINE_CACHE_TIMEOUT)
+    return outline
+
+
+async def aget_course_outline(course_pk):
+    '''Async counterpart of get_course_outline, for views that render the
+    sidebar without touching the database from the template'''
+    version = await acourse_content_version(course_pk)
+    key = outline_cache_key(course_pk, version)
+    outline = await cache.aget(key)
+    if outline is None:
+        outline = await abuild_course_outline(course_pk)
+        await cache.aset(key, outline, OUTLINE_CACHE_TIMEOUT)
+    return VersionedOutline(version, outline)
+
+
+async def aget_steps_html(course_pk):
+    '''The sidebar's list of steps for async views. It is read from and stored
+    in the same entry as the {% cache %} fragment of step_sidebar.html,
+    through the async cache API, so rendering makes no blocking cache calls.'''
+    version = await acourse_content_version(course_pk)
+    key = make_template_fragment_key(STEPS_FRAGMENT, [course_pk, version])
+    html = await cache.aget(key)
+    if html is None:
+        outline = await aget_course_outline(course_pk)
+        html = render_to_string('courses/step_outline.html', {'outline': outline.entries})
+        await cache.aset(key, html, OUTLINE_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+def invalidate_course_outline(course_pk):
+    bump_version(content_version_key(course_pk))
@@ -0,0 +1,55 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+
+# one page of keyset results; next_cursor is None on the last page
+KeysetPage = namedtuple('KeysetPage', ['items', 'next_cursor'])
+
+
+def encode_cursor(values):
+    '''Packs the sort key of the last row on a page into an opaque URL-safe token'''
+    data = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length=1):
+    '''Unpacks a cursor, returning None for a missing or malformed one'''
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        return None
+    return values
+
+
+def paginate_by_pk(queryset, cursor, per_page):
+    '''Returns the page of `queryset` following `cursor`, ordered by primary key'''
+    after = decode_cursor(cursor)
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after[0])
+    # fetch one extra row to find out whether there is a next page
+    items = list(queryset.order_by('pk')[:per_page + 1])
+    if len(items) > per_page:
+        items = items[:per_page]
+        return KeysetPage(items, encode_cursor([items[-1].pk]))
+    return KeysetPage(items, None)
+
+
+async def apaginate_by_pk(queryset, cursor, per_page):
+    '''Async counterpart of paginate_by_pk'''
+    after = decode_cursor(cursor)
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after[0])
+    items = [item async for item in queryset.order_by('pk')[:per_page + 1]]
+    if len(items) > per_page:
+        items = items[:per_page]
+        return KeysetPage(items, encode_cursor([items[-1].pk]))
+    return KeysetPage(items, None)
@@ -0,0 +1,71 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from . import models
+from .caching import bump_version, get_version
+from .grading import AnswerKey
+
+
+PAYLOAD_CACHE_TIMEOUT = 60 * 60 * 24
+# moved on whenever the fields of QuizPayload or KeyQuestion change, so
+# payloads pickled by an older release are never read back
+PAYLOAD_FORMAT = 2
+
+# everything needed to render and grade a quiz: the Quiz with its course,
+# and the answer key of its questions, answers and correct answers
+QuizPayload = namedtuple('QuizPayload', ['version', 'quiz', 'key'])
+
+
+def quiz_version_key(quiz_pk):
+    return 'courses:quiz-version:{}'.format(quiz_pk)
+
+
+def quiz_version(quiz_pk):
+    '''Version of a quiz's content, moved on whenever the quiz, a question or an answer changes'''
+    return get_version(quiz_version_key(quiz_pk))
+
+
+def existing_quiz_version(quiz_pk):
+    '''quiz_version() of a quiz that exists, or None. Version keys never
+    expire, so one is only created after checking the quiz is in the database.'''
+    version = cache.get(quiz_version_key(quiz_pk))
+    if version is None and models.Quiz.objects.filter(pk=quiz_pk).exists():
+        version = quiz_version(quiz_pk)
+    return version
+
+
+def payload_cache_key(quiz_pk, version):
+    return 'courses:quiz-payload:{}:{}:{}'.format(PAYLOAD_FORMAT, quiz_pk, version)
+
+
+def build_quiz_payload(quiz_pk, version):
+    quiz = models.Quiz.objects.select_related('course').filter(pk=quiz_pk).first()
+    if quiz is None:
+        return None
+    return QuizPayload(version, quiz, AnswerKey.for_quiz(quiz_pk))
+
+
+def get_quiz_payload(quiz_pk):
+    '''Returns the cached payload of a quiz, building it on a miss, or None
+    if the quiz does not exist'''
+    version = existing_quiz_version(quiz_pk)
+    if version is None:
+        return None
+    key = payload_cache_key(quiz_pk, version)
+    payload = cache.get(key)
+    if payload is None:
+        payload = build_quiz_payload(quiz_pk, version)
+        if payload is not None:
+            cache.set(key, payload, PAYLOAD_CACHE_TIMEOUT)
+    return payload
+
+
+def invalidate_quiz_payload(quiz_pk):
+    bump_version(quiz_version_key(quiz_pk))
+
+
+def forget_quiz_payload(quiz_pk):
+    '''Drops the version key of a deleted quiz. A quiz that comes back, in a
+    rolled back deletion, starts again from a fresh clock-based version.'''
+    cache.delete(quiz_version_key(quiz_pk))
@@ -0,0 +1,110 @@
+'''Registry of question types: the concrete model, authoring form and
+grading function behind each Question.question_type code.
+
+A new type is a Question subclass, a ModelForm and a register() call here;
+views, grading and the quiz interchange format look types up instead of
+branching on codes.'''
+import math
+
+from django.core.exceptions import ObjectDoesNotExist
+
+from . import forms, models
+
+
+class QuestionType:
+    def __init__(self, code, model, form_class, slug, grade, free_text=False):
+        self.code = code
+        self.model = model
+        self.form_class = form_class
+        # used in create_question URLs
+        self.slug = slug
+        # grade(key_question, submitted) -> (your_answer, correct); your_answer is None if invalid
+        self.grade = grade
+        # answered by typing text rather than picking an Answer
+        self.free_text = free_text
+        # reverse one-to-one from Question to the child row
+        self.accessor = model._meta.model_name
+
+
+registry = {}
+
+
+def register(code, model, form_class, slug, grade, free_text=False):
+    registry[code] = QuestionType(code, model, form_class, slug, grade, free_text)
+
+
+def get_type(code):
+    return registry[code]
+
+
+def for_slug(slug):
+    return next((question_type for question_type in registry.values() if question_type.slug == slug), None)
+
+
+def for_model(model):
+    return next((question_type for question_type in registry.values() if question_type.model is model), None)
+
+
+def with_subtypes(queryset):
+    '''Joins every registered child table, so concrete() needs no queries'''
+    return queryset.select_related(*(question_type.accessor for question_type in registry.values()))
+
+
+def concrete(question):
+    '''Returns the MultipleChoiceQuestion/TrueFalseQuestion/... row behind a
+    Question loaded through with_subtypes()'''
+    if type(question) is not models.Question:
+        return question
+    # the declared type first; its form can change question_type, so fall back to the others
+    declared = registry.get(question.question_type)
+    candidates = [declared] if declared else []
+    candidates += [question_type for question_type in registry.values() if question_type is not declared]
+    for question_type in candidates:
+        try:
+            return getattr(question, question_type.accessor)
+        except ObjectDoesNotExist:
+            continue
+    return question
+
+
+def concrete_questions(quiz_pk):
+    '''Every question of a quiz as its concrete model, in one query'''
+    queryset = with_subtypes(models.Question.objects.filter(quiz_id=quiz_pk))
+    return [concrete(question) for question in queryset]
+
+
+def grade_choice(question, submitted):
+    answer = next((answer for answer in question.answers if str(answer.pk) == submitted), None)
+    return answer, answer is not None and answer.correct
+
+
+# numeric user input answers within this tolerance of the key are correct
+TEXT_REL_TOLERANCE = 1e-6
+TEXT_ABS_TOLERANCE = 1e-9
+
+
+def parse_number(text):
+    '''The value of a numeric answer such as "9.81" or "1e3", or NaN'''
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return math.nan
+    return value if math.isfinite(value) else math.nan
+
+
+def texts_match(submitted, expected):
+    submitted_value, expected_value = parse_number(submitted), parse_number(expected)
+    if math.isnan(submitted_value) or math.isnan(expected_value):
+        return submitted.strip() == expected.strip()
+    return math.isclose(submitted_value, expected_value,
+                        rel_tol=TEXT_REL_TOLERANCE, abs_tol=TEXT_ABS_TOLERANCE)
+
+
+def grade_text(question, submitted):
+    correct = question.correct_answer is not None and texts_match(submitted, question.correct_answer.text)
+    return submitted, correct
+
+
+register('MCQ', models.MultipleChoiceQuestion, forms.MultipleChoiceQuestionForm, 'mc', grade_choice)
+register('TFQ', models.TrueFalseQuestion, forms.TrueFalseQuestionForm, 'tf', grade_choice)
+register('UIQ', models.UserInputQuestion, forms.UserInputQuestionForm, 'ui', grade_text, free_text=True)
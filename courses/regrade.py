@@ -0,0 +1,172 @@
+'''Regrades stored attempts after a quiz's answer key has been corrected.
+
+Stored AttemptAnswer rows are read in chunks and their correctness is
+recomputed against the current key in one vectorized pass per chunk when
+NumPy is installed, or row by row otherwise. Only rows, scores and item
+statistics that actually change are written. Attempts stored before
+responses were kept have nothing to regrade from and are left as they are.'''
+from collections import Counter, defaultdict, namedtuple
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F
+
+from . import models, question_types
+from .grading import AnswerKey
+
+try:
+    import numpy as np
+except ImportError:  # optional, regrading falls back to plain Python
+    np = None
+
+
+# rows per UPDATE, within the SQLite parameter limit
+WRITE_BATCH_SIZE = 500
+
+# skipped: completed attempts without stored responses, whose scores are kept
+RegradeResult = namedtuple('RegradeResult', ['attempts', 'skipped', 'responses', 'changed_responses',
+                                             'changed_scores'])
+
+
+class KeyArrays:
+    '''The answer key of a quiz in the shape the chunk grader needs'''
+
+    def __init__(self, key):
+        self.index = {question.pk: i for i, question in enumerate(key)}
+        self.free_text = [question.free_text for question in key]
+        self.expected = [question.correct_answer.text if question.correct_answer else None for question in key]
+        self.correct_ids = {answer.pk for question in key for answer in question.answers if answer.correct}
+        if np is not None:
+            self.free_text_array = np.array(self.free_text, dtype=bool)
+            self.expected_values = np.array([question_types.parse_number(text) for text in self.expected])
+            self.correct_id_array = np.array(sorted(self.correct_ids), dtype=np.int64)
+
+
+def is_correct(keys, question_id, answer_id, text):
+    i = keys.index[question_id]
+    if keys.free_text[i]:
+        return keys.expected[i] is not None and question_types.texts_match(text, keys.expected[i])
+    return answer_id in keys.correct_ids
+
+
+def grade_chunk_numpy(keys, question_ids, answer_ids, texts):
+    '''Correctness of each stored response in a chunk under the current key'''
+    questions = np.array([keys.index[pk] for pk in question_ids], dtype=np.int64)
+    answers = np.array([-1 if pk is None else pk for pk in answer_ids], dtype=np.int64)
+    correct = np.isin(answers, keys.correct_id_array)
+
+    rows = np.flatnonzero(keys.free_text_array[questions])
+    if len(rows):
+        values = np.array([question_types.parse_number(texts[row]) for row in rows])
+        expected = keys.expected_values[questions[rows]]
+        numeric = ~np.isnan(values) & ~np.isnan(expected)
+        matched = np.zeros(len(rows), dtype=bool)
+        matched[numeric] = np.isclose(values[numeric], expected[numeric],
+                                      rtol=question_types.TEXT_REL_TOLERANCE,
+                                      atol=question_types.TEXT_ABS_TOLERANCE)
+        # answers that are not numbers are compared as text
+        for j in np.flatnonzero(~numeric):
+            expected_text = keys.expected[questions[rows[j]]]
+            matched[j] = expected_text is not None and question_types.texts_match(texts[rows[j]], expected_text)
+        correct[rows] = matched
+    return correct
+
+
+class Tally:
+    '''New scores per attempt, and the responses whose correctness flipped'''
+
+    def __init__(self):
+        self.responses = 0
+        # attempts with at least one stored response
+        self.attempts = set()
+        self.scores = Counter()
+        self.now_correct, self.now_wrong = [], []
+        self.statistic_deltas = Counter()
+
+    def add_python(self, keys, chunk):
+        for pk, attempt_id, question_id, answer_id, text, was_correct in chunk:
+            self.attempts.add(attempt_id)
+            correct = is_correct(keys, question_id, answer_id, text)
+            if correct:
+                self.scores[attempt_id] += 1
+            if correct and not was_correct:
+                self.now_correct.append(pk)
+                self.statistic_deltas[question_id] += 1
+            elif was_correct and not correct:
+                self.now_wrong.append(pk)
+                self.statistic_deltas[question_id] -= 1
+
+    def add_numpy(self, keys, chunk):
+        pks, attempt_ids, question_ids, answer_ids, texts, stored = zip(*chunk)
+        correct = grade_chunk_numpy(keys, question_ids, answer_ids, texts)
+        pks, attempt_ids, question_ids = (np.array(values, dtype=np.int64)
+                                          for values in (pks, attempt_ids, question_ids))
+        stored = np.array(stored, dtype=bool)
+        gained, lost = correct & ~stored, stored & ~correct
+
+        self.attempts.update(np.unique(attempt_ids).tolist())
+        self.scores.update(counts(attempt_ids[correct]))
+        self.now_correct += pks[gained].tolist()
+        self.now_wrong += pks[lost].tolist()
+        self.statistic_deltas.update(counts(question_ids[gained]))
+        self.statistic_deltas.subtract(counts(question_ids[lost]))
+
+    def add(self, keys, chunk):
+        self.responses += len(chunk)
+        if np is not None:
+            self.add_numpy(keys, chunk)
+        else:
+            self.add_python(keys, chunk)
+
+
+def counts(values):
+    unique, totals = np.unique(values, return_counts=True)
+    return dict(zip(unique.tolist(), totals.tolist()))
+
+
+def update_in_batches(queryset, pks, **values):
+    for start in range(0, len(pks), WRITE_BATCH_SIZE):
+        queryset.filter(pk__in=pks[start:start + WRITE_BATCH_SIZE]).update(**values)
+
+
+def regrade_quiz(quiz_pk, chunk_size=10000, dry_run=False):
+    '''Recomputes AttemptAnswer.correct and QuizTaker.correct_answers of every
+    completed attempt of a quiz that has stored responses, and adjusts the
+    item statistics to match'''
+    keys = KeyArrays(AnswerKey.for_quiz(quiz_pk))
+    responses = models.AttemptAnswer.objects.filter(attempt__quiz_id=quiz_pk, attempt__completed=True)
+
+    tally = Tally()
+    with transaction.atomic():
+        rows = responses.values_list('pk', 'attempt_id', 'question_id', 'answer_id', 'text', 'correct')
+        iterator = rows.order_by().iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                break
+            tally.add(keys, chunk)
+
+        attempts = models.QuizTaker.objects.filter(quiz_id=quiz_pk, completed=True)
+        # scores take few distinct values, so one UPDATE per score and batch beats bulk_update()'s CASE
+        changed = defaultdict(list)
+        skipped = 0
+        for pk, correct_answers in attempts.values_list('pk', 'correct_answers').iterator(chunk_size=chunk_size):
+            if pk not in tally.attempts:
+                skipped += 1
+            elif correct_answers != tally.scores[pk]:
+                changed[tally.scores[pk]].append(pk)
+        result = RegradeResult(len(tally.attempts), skipped, tally.responses,
+                               len(tally.now_correct) + len(tally.now_wrong),
+                               sum(len(pks) for pks in changed.values()))
+        if dry_run:
+            return result
+
+        update_in_batches(models.AttemptAnswer.objects.all(), tally.now_correct, correct=True)
+        update_in_batches(models.AttemptAnswer.objects.all(), tally.now_wrong, correct=False)
+        for score, pks in changed.items():
+            update_in_batches(models.QuizTaker.objects.all(), pks, correct_answers=score)
+        for question_id, delta in tally.statistic_deltas.items():
+            if delta:
+                models.QuestionStatistic.objects.filter(question_id=question_id).update(
+                    correct=F('correct') + delta)
+    return result
@@ -0,0 +1,80 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+import markdown2
+from django.conf import settings
+
+
+def markdown_extras():
+    return list(getattr(settings, 'MARKDOWN_EXTRAS', []))
+
+
+def content_hash(markdown_text, extras=None):
+    '''Hashes markdown together with the extras it is rendered with'''
+    if extras is None:
+        extras = markdown_extras()
+    digest = hashlib.sha1(','.join(sorted(extras)).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(markdown_text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def render_markdown(markdown_text, extras=None):
+    '''Converts markdown text to HTML. Module level so a process pool can call it'''
+    if extras is None:
+        extras = markdown_extras()
+    return str(markdown2.markdown(markdown_text, extras=extras))
+
+
+class LRUCache:
+    '''A small thread-safe least-recently-used mapping'''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+rendered_cache = LRUCache(getattr(settings, 'MARKDOWN_CACHE_SIZE', 256))
+
+
+def cached_markdown(markdown_text, digest=None):
+    '''Returns rendered HTML for markdown text, rendering only on a cache miss'''
+    if digest is None:
+        digest = content_hash(markdown_text)
+    html = rendered_cache.get(digest)
+    if html is None:
+        html = render_markdown(markdown_text)
+        rendered_cache.set(digest, html)
+    return html
+
+
+def text_html(text):
+    '''Returns the HTML for a Text step, preferring the copy stored on the row'''
+    digest = content_hash(text.content)
+    if text.content_hash == digest:
+        return text.content_html
+    return cached_markdown(text.content, digest)
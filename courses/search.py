@@ -0,0 +1,166 @@
+import re
+from collections import namedtuple
+
+from django.db import connection
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.html import escape
+
+from . import models
+
+
+SEARCH_TABLE = 'courses_search'
+
+# rowids interleave the two indexed models so single rows can be replaced by key
+COURSE, TEXT = 'course', 'text'
+ROWID_OFFSET = {COURSE: 0, TEXT: 1}
+
+# placeholder highlight markers, swapped for <mark> after escaping the snippet
+MARK_START, MARK_END = '\x02', '\x03'
+
+SearchHit = namedtuple('SearchHit', ['kind', 'pk', 'title', 'course_pk', 'course_title', 'snippet', 'url', 'score'])
+
+
+def search_available():
+    return connection.vendor == 'sqlite'
+
+
+def search_rowid(kind, pk):
+    return pk * 2 + ROWID_OFFSET[kind]
+
+
+def create_search_table():
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5("
+            "title, body, kind UNINDEXED, object_id UNINDEXED, course_id UNINDEXED, "
+            "tokenize='porter unicode61')".format(SEARCH_TABLE)
+        )
+
+
+def rebuild_search_index():
+    '''Drops and repopulates the full-text index straight from the source tables'''
+    if not search_available():
+        return
+    course_table = models.Course._meta.db_table
+    text_table = models.Text._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS {}".format(SEARCH_TABLE))
+        create_search_table()
+        cursor.execute(
+            "INSERT INTO {} (rowid, title, body, kind, object_id, course_id) "
+            "SELECT id * 2 + %s, title, description, %s, id, id FROM {}".format(SEARCH_TABLE, course_table),
+            [ROWID_OFFSET[COURSE], COURSE],
+        )
+        cursor.execute(
+            "INSERT INTO {} (rowid, title, body, kind, object_id, course_id) "
+            "SELECT id * 2 + %s, title, description || char(10) || content, %s, id, course_id "
+            "FROM {}".format(SEARCH_TABLE, text_table),
+            [ROWID_OFFSET[TEXT], TEXT],
+        )
+        cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(SEARCH_TABLE))
+
+
+def _replace_row(kind, pk, course_pk, title, body):
+    if not search_available():
+        return
+    rowid = search_rowid(kind, pk)
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {} WHERE rowid = %s".format(SEARCH_TABLE), [rowid])
+        cursor.execute(
+            "INSERT INTO {} (rowid, title, body, kind, object_id, course_id) "
+            "VALUES (%s, %s, %s, %s, %s, %s)".format(SEARCH_TABLE),
+            [rowid, title, body, kind, pk, course_pk],
+        )
+
+
+def remove_from_index(kind, pk):
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {} WHERE rowid = %s".format(SEARCH_TABLE), [search_rowid(kind, pk)])
+
+
+def index_course(course):
+    _replace_row(COURSE, course.pk, course.pk, course.title, course.description)
+
+
+def index_text(text):
+    _replace_row(TEXT, text.pk, text.course_id, text.title, '{}\n{}'.format(text.description, text.content))
+
+
+def match_expression(term):
+    '''Turns free text into an FTS5 query matching every word, with prefix matching on the last'''
+    words = re.findall(r'\w+', term or '')
+    if not words:
+        return ''
+    phrases = ['"{}"'.format(word) for word in words]
+    phrases[-1] += '*'
+    return ' '.join(phrases)
+
+
+def highlight(snippet):
+    return escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def hit_url(kind, pk, course_pk):
+    if kind == TEXT:
+        return reverse('courses:text detail view', kwargs={'course_pk': course_pk, 'step_pk': pk})
+    return reverse('courses:course detail view', kwargs={'pk': pk})
+
+
+def search(term, limit=20, after=None):
+    '''Returns up to `limit` ranked hits in published courses, following the
+    (score, rowid) sort key `after` of the previous page'''
+    expression = match_expression(term)
+    if not expression:
+        return []
+    if not search_available():
+        return _fallback_search(term, limit, after)
+
+    keyset = ''
+    params = [MARK_START, MARK_END, expression]
+    if after is not None:
+        keyset = "WHERE score > %s OR (score = %s AND rid > %s) "
+        params += [after[0], after[0], after[1]]
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT kind, object_id, title, course_id, course_title, snippet, score FROM ("
+            "SELECT {0}.rowid AS rid, {0}.kind AS kind, {0}.object_id AS object_id, "
+            "{0}.title AS title, {0}.course_id AS course_id, course.title AS course_title, "
+            "snippet({0}, 1, %s, %s, '...', 16) AS snippet, bm25({0}, 10.0, 1.0) AS score "
+            "FROM {0} JOIN {1} AS course ON course.id = {0}.course_id "
+            "WHERE {0} MATCH %s AND course.published"
+            ") {2}ORDER BY score, rid LIMIT %s".format(SEARCH_TABLE, models.Course._meta.db_table, keyset),
+            params,
+        )
+        rows = cursor.fetchall()
+
+    return [
+        SearchHit(kind, pk, title, course_pk, course_title, highlight(snippet),
+                  hit_url(kind, pk, course_pk), score)
+        for kind, pk, title, course_pk, course_title, snippet, score in rows
+    ]
+
+
+def hit_cursor(hit):
+    '''The keyset sort key of a hit, for passing back to search() as `after`'''
+    return [hit.score, search_rowid(hit.kind, hit.pk)]
+
+
+def _fallback_search(term, limit, after):
+    courses = models.Course.objects.filter(
+        Q(title__icontains=term) | Q(description__icontains=term),  # or
+        published=True,
+    )
+    if after is not None:
+        courses = courses.filter(pk__gt=after[1] // 2)
+    courses = courses.order_by('pk').values_list('pk', 'title', 'description')[:limit]
+    return [
+        SearchHit(COURSE, pk, title, pk, title, escape(description[:200]), hit_url(COURSE, pk, pk), 0)
+        for pk, title, description in courses
+    ]
@@ -0,0 +1,109 @@
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import db, enrollment, models, question_types, search
+from .catalogue import invalidate_catalogue
+from .outline import invalidate_course_outline
+from .payload import forget_quiz_payload, invalidate_quiz_payload
+
+
+@receiver(post_save, sender=models.Text)
+@receiver(post_save, sender=models.Quiz)
+@receiver(post_delete, sender=models.Text)
+@receiver(post_delete, sender=models.Quiz)
+def step_changed(sender, instance, **kwargs):
+    invalidate_course_outline(instance.course_id)
+
+
+@receiver(post_save, sender=models.Quiz)
+def quiz_changed(sender, instance, **kwargs):
+    invalidate_quiz_payload(instance.pk)
+
+
+@receiver(post_delete, sender=models.Quiz)
+def quiz_deleted(sender, instance, **kwargs):
+    # sent after the quiz's questions and answers, so nothing recreates the key
+    forget_quiz_payload(instance.pk)
+
+
+def question_changed(sender, instance, **kwargs):
+    invalidate_quiz_payload(instance.quiz_id)
+
+
+# saving a subclass sends signals for the subclass only, so connect every registered type
+for sender in [models.Question] + [question_type.model for question_type in question_types.registry.values()]:
+    post_save.connect(question_changed, sender=sender)
+    post_delete.connect(question_changed, sender=sender)
+
+
+@receiver(post_save, sender=models.Answer)
+@receiver(post_delete, sender=models.Answer)
+def answer_changed(sender, instance, origin=None, **kwargs):
+    if origin is not None and getattr(origin, 'model', type(origin)) is not models.Answer:
+        # cascaded from a question, quiz or course deletion, whose own signal invalidates
+        return
+    if models.Answer.question.is_cached(instance):
+        quiz_pk = instance.question.quiz_id
+    else:
+        quiz_pk = models.Question.objects.filter(pk=instance.question_id).values_list('quiz_id', flat=True).first()
+    if quiz_pk is not None:
+        invalidate_quiz_payload(quiz_pk)
+
+
+@receiver(post_delete, sender=models.Text)
+@receiver(post_delete, sender=models.Quiz)
+def step_deleted(sender, instance, **kwargs):
+    # runs inside the deletion's transaction; step additions are counted in Step.save()
+    models.Course.objects.filter(pk=instance.course_id).update(step_count=F('step_count') - 1)
+
+
+@receiver(post_save, sender=models.Course)
+def course_saved(sender, instance, created, **kwargs):
+    listing = instance.listing()
+    if created or listing != getattr(instance, '_loaded_listing', None):
+        invalidate_catalogue()
+        if not created:
+            # quiz payloads carry the course title
+            for quiz_pk in models.Quiz.objects.filter(course_id=instance.pk).values_list('pk', flat=True):
+                invalidate_quiz_payload(quiz_pk)
+    instance._loaded_listing = listing
+
+
+@receiver(post_delete, sender=models.Course)
+def course_deleted(sender, instance, **kwargs):
+    invalidate_catalogue()
+
+
+@receiver(post_save, sender=models.Course)
+def index_course(sender, instance, **kwargs):
+    search.index_course(instance)
+
+
+@receiver(post_save, sender=models.Text)
+def index_text(sender, instance, **kwargs):
+    search.index_text(instance)
+
+
+@receiver(post_delete, sender=models.Course)
+def unindex_course(sender, instance, **kwargs):
+    search.remove_from_index(search.COURSE, instance.pk)
+
+
+@receiver(post_delete, sender=models.Text)
+def unindex_text(sender, instance, **kwargs):
+    search.remove_from_index(search.TEXT, instance.pk)
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    db.configure_sqlite(connection)
+
+
+def create_search_table(sender, **kwargs):
+    search.create_search_table()
+
+
+def create_email_index(sender, **kwargs):
+    enrollment.create_email_index()
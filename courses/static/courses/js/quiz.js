@@ -0,0 +1,129 @@
+// Renders a quiz from the JSON API (courses/api.py) and submits it in one POST.
+(function () {
+  'use strict';
+
+  var app = document.getElementById('quiz-app');
+  if (!app) {
+    return;
+  }
+  var status = app.querySelector('.quiz-status');
+  var list = app.querySelector('.quiz-questions');
+  var submit = app.querySelector('.quiz-submit');
+  var questions = [];
+
+  function request(url, body) {
+    var options = {credentials: 'same-origin', headers: {'Accept': 'application/json'}};
+    if (body !== undefined) {
+      options.method = 'POST';
+      options.headers['Content-Type'] = 'application/json';
+      options.headers['X-CSRFToken'] = app.dataset.csrfToken;
+      options.body = JSON.stringify(body);
+    }
+    return fetch(url, options).then(function (response) {
+      return response.json().then(function (data) {
+        if (!response.ok) {
+          throw data;
+        }
+        return data;
+      });
+    });
+  }
+
+  function element(tag, properties, children) {
+    var node = document.createElement(tag);
+    Object.keys(properties || {}).forEach(function (key) {
+      node[key] = properties[key];
+    });
+    (children || []).forEach(function (child) {
+      node.appendChild(child);
+    });
+    return node;
+  }
+
+  function ordered(question, order) {
+    var ids = order[question.id];
+    if (!ids) {
+      return question.answers;
+    }
+    var byId = {};
+    question.answers.forEach(function (answer) {
+      byId[answer[0]] = answer;
+    });
+    return ids.map(function (id) {
+      return byId[id];
+    });
+  }
+
+  function render(content, attempt) {
+    questions = content.questions;
+    list.textContent = '';
+    questions.forEach(function (question, index) {
+      var name = 'question-' + question.id;
+      var inputs;
+      if (question.text) {
+        inputs = [element('div', {className: 'callout'}, [
+          element('input', {type: 'text', name: name, id: name}),
+          element('label', {htmlFor: name, textContent: 'Answer Here (accepts numeric values)'})
+        ])];
+      } else {
+        inputs = ordered(question, attempt.order).map(function (answer) {
+          var id = 'answer-' + answer[0];
+          return element('div', {className: 'callout'}, [
+            element('input', {type: 'radio', name: name, id: id, value: answer[0]}),
+            element('label', {htmlFor: id, textContent: answer[1]})
+          ]);
+        });
+      }
+      list.appendChild(element('li', {id: name + '-item'}, [
+        element('h2', {}, [element('strong', {textContent: (index + 1) + ': ' + question.prompt})])
+      ].concat(inputs, [element('p', {className: 'quiz-feedback'})])));
+    });
+    status.textContent = attempt.completed ? 'Previous score: ' + attempt.score + ' / ' + questions.length : '';
+    submit.hidden = false;
+    if (window.MathJax && MathJax.Hub) {
+      MathJax.Hub.Queue(['Typeset', MathJax.Hub, list]);
+    }
+  }
+
+  function answers() {
+    var data = {};
+    questions.forEach(function (question) {
+      var name = 'question-' + question.id;
+      var input = question.text
+        ? list.querySelector('input[name="' + name + '"]')
+        : list.querySelector('input[name="' + name + '"]:checked');
+      if (input) {
+        data[question.id] = input.value;
+      }
+    });
+    return data;
+  }
+
+  function showResults(result) {
+    status.textContent = 'You got ' + result.score + ' correct out of ' + result.total;
+    result.results.forEach(function (row) {
+      var feedback = document.querySelector('#question-' + row[0] + '-item .quiz-feedback');
+      feedback.style.color = row[1] ? 'green' : 'red';
+      feedback.textContent = row[1] ? 'Correct!' : 'Incorrect! Answer should be: ' + row[2];
+    });
+    submit.hidden = true;
+  }
+
+  submit.addEventListener('click', function () {
+    submit.disabled = true;
+    request(app.dataset.submitUrl, {answers: answers()}).then(showResults, function (error) {
+      status.textContent = error.error || 'Could not submit your answers';
+      if (error.question) {
+        document.getElementById('question-' + error.question + '-item').scrollIntoView();
+      }
+    }).then(function () {
+      submit.disabled = false;
+    });
+  });
+
+  Promise.all([request(app.dataset.contentUrl), request(app.dataset.attemptUrl, {})]).then(function (data) {
+    render(data[0], data[1]);
+  }, function (error) {
+    status.textContent = error.error || 'Could not load the quiz';
+  });
+})();
@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import F, Prefetch
+
+from . import models, question_types
+
+
+ItemRow = namedtuple('ItemRow', ['question', 'free_text', 'responses', 'correct', 'facility', 'answers'])
+DistractorRow = namedtuple('DistractorRow', ['answer', 'chosen', 'share'])
+
+
+def record_responses(rows, delta=1):
+    '''Adds (or with delta=-1 removes) AttemptAnswer rows to the item statistics.
+    The number of queries does not depend on how many rows are applied.'''
+    question_ids = [row.question_id for row in rows]
+    correct_ids = [row.question_id for row in rows if row.correct]
+    answer_ids = [row.answer_id for row in rows if row.answer_id is not None]
+
+    if delta > 0:
+        models.QuestionStatistic.objects.bulk_create(
+            [models.QuestionStatistic(question_id=pk) for pk in question_ids],
+            ignore_conflicts=True,
+        )
+        if answer_ids:
+            models.AnswerStatistic.objects.bulk_create(
+                [models.AnswerStatistic(answer_id=pk) for pk in answer_ids],
+                ignore_conflicts=True,
+            )
+
+    if question_ids:
+        models.QuestionStatistic.objects.filter(question_id__in=question_ids).update(
+            responses=F('responses') + delta)
+    if correct_ids:
+        models.QuestionStatistic.objects.filter(question_id__in=correct_ids).update(
+            correct=F('correct') + delta)
+    if answer_ids:
+        models.AnswerStatistic.objects.filter(answer_id__in=answer_ids).update(
+            chosen=F('chosen') + delta)
+
+
+def _count(instance, attribute, field):
+    try:
+        return getattr(getattr(instance, attribute), field)
+    except ObjectDoesNotExist:
+        return 0
+
+
+def item_analysis(quiz_pk):
+    '''Facility and distractor counts for every question of a quiz, read in two queries'''
+    answers = models.Answer.objects.select_related('answerstatistic')
+    questions = models.Question.objects.filter(quiz_id=quiz_pk).select_related(
+        'questionstatistic',
+    ).prefetch_related(Prefetch('answer_set', queryset=answers))
+
+    rows = []
+    for question in questions:
+        responses = _count(question, 'questionstatistic', 'responses')
+        correct = _count(question, 'questionstatistic', 'correct')
+        facility = round(100 * correct / responses) if responses else None
+        distractors = []
+        for answer in question.answer_set.all():
+            chosen = _count(answer, 'answerstatistic', 'chosen')
+            share = round(100 * chosen / responses) if responses else None
+            distractors.append(DistractorRow(answer, chosen, share))
+        free_text = question_types.get_type(question.question_type).free_text
+        rows.append(ItemRow(question, free_text, responses, correct, facility, distractors))
+    return rows
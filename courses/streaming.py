@@ -0,0 +1,133 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    '''Returns the inclusive (start, end) byte range a Range header asks for, or
+    None to serve the whole file. Only single ranges are honoured.'''
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the final `last` bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def file_iterator(path, start, length, chunk_size):
+    '''Yields `length` bytes of a file from `start`, holding at most one chunk in memory'''
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def file_etag(stat):
+    return '"{:x}-{:x}"'.format(int(stat.st_mtime), stat.st_size)
+
+
+def not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def range_applies(request, etag, mtime):
+    '''A Range is only honoured when If-Range, if sent, still matches the file'''
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.strip() == etag:
+        return True
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and int(mtime) <= if_range_date
+
+
+def sendfile_response(field_file, content_type):
+    '''Hands the transfer to the front-end server when VIDEO_SENDFILE_HEADER is set'''
+    header = settings.VIDEO_SENDFILE_HEADER
+    response = HttpResponse(content_type=content_type)
+    if header == 'X-Accel-Redirect':
+        response[header] = getattr(settings, 'VIDEO_ACCEL_REDIRECT_PREFIX', '/protected-media/') + field_file.name
+    else:
+        response[header] = field_file.path
+    return response
+
+
+def serve_file(request, field_file):
+    '''Serves a stored file with Range, conditional request and caching support'''
+    content_type = mimetypes.guess_type(field_file.name)[0] or 'application/octet-stream'
+    if getattr(settings, 'VIDEO_SENDFILE_HEADER', None):
+        return sendfile_response(field_file, content_type)
+
+    path = field_file.path
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404
+    size = stat.st_size
+    etag = file_etag(stat)
+
+    if not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    try:
+        byte_range = None
+        if range_applies(request, etag, stat.st_mtime):
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+        return response
+
+    start, end = byte_range if byte_range else (0, size - 1)
+    length = end - start + 1 if size else 0
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    else:
+        response = StreamingHttpResponse(
+            file_iterator(path, start, length, getattr(settings, 'VIDEO_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)),
+            content_type=content_type,
+        )
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
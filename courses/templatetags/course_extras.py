@@ -1,24 +1,47 @@
+from functools import partial
+
 from django import template
 from django.utils.safestring import mark_safe
 
-import markdown2
-
-from courses.models import Course
+from courses.catalogue import newest_courses
+from courses.outline import OUTLINE_CACHE_TIMEOUT, course_content_version, get_course_outline
+from courses.rendering import cached_markdown, text_html
 
 
 register = template.Library()
 
 @register.simple_tag
 def newest_course():
-    '''Gets the most recent course that was added to the library'''
-    return Course.objects.filter(published=True).latest('created_at')
+    '''Gets the most recent course that was added to the library, or None'''
+    courses = newest_courses()
+    return courses[0] if courses else None
 
 
 @register.inclusion_tag('courses/course_nav.html')
 def nav_courses_list():
     '''Returns dictionary of courses to display as navigation pane'''
-    courses = Course.objects.filter(published=True).order_by('-created_at').values('id', 'title')[:5]
-    return {'courses': courses}
+    return {'courses': newest_courses()}
+
+
+@register.inclusion_tag('courses/step_sidebar.html')
+def step_sidebar(course, current_step=None, steps_html=None):
+    '''Renders the sidebar of a course's steps from a fragment cached per content
+    version. The current step is highlighted outside the cached fragment.
+    Async views pass in the fragment they have already read with
+    outline.aget_steps_html().'''
+    current_id = ''
+    if current_step:
+        current_id = 'step-{}-{}'.format(current_step._meta.model_name, current_step.pk)
+    if steps_html:
+        return {'course': course, 'steps_html': steps_html, 'current_id': current_id}
+    return {
+        'course': course,
+        'version': course_content_version(course.pk),
+        'timeout': OUTLINE_CACHE_TIMEOUT,
+        # only called when the fragment has to be rendered
+        'outline': partial(get_course_outline, course.pk),
+        'current_id': current_id,
+    }
 
 
 @register.filter('time_estimate')
@@ -33,5 +56,11 @@ def time_estimate(word_count):
 @register.filter('markdown_to_html')
 def markdown_to_html(markdown_text):
     '''Converts markdown text to HTML'''
-    html_body = markdown2.markdown(markdown_text)
+    html_body = cached_markdown(markdown_text)
     return mark_safe(html_body)
+
+
+@register.filter('text_to_html')
+def text_to_html(text):
+    '''Returns the pre-rendered HTML content of a Text step'''
+    return mark_safe(text_html(text))
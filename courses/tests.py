@@ -1,14 +1,59 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.http import Http404
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from django.test import TestCase
+from django.template import Context, Template
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
 from django.utils import timezone
-from .models import Course, Step
+from learning_site.forms import UserRegisterForm
+from learning_site.instrumentation import Histogram, read_log, recorder
+from . import async_views, question_types, regrade
+from .db import configure_sqlite, retry_on_lock
+from .enrollment import EMAIL_INDEX, create_email_index, users_with_email
+from .grading import AnswerKey, IncompleteSubmission, save_result, start_attempt
+from .interchange import QuizFormatError, export_quiz, import_quiz, read_quiz
+from .management.commands.bench_login import HashCounter
+from .models import (Answer, AnswerStatistic, AttemptAnswer, Course, OutboxMessage, QuestionStatistic, VideoUpload, MultipleChoiceQuestion, QuizTaker, Text,
+                     Question, Quiz, TrueFalseQuestion, UserInputQuestion)
+from .outbox import deliver_batch, enqueue_mail
+from .outline import aget_course_outline, get_course_outline
+from .pagination import decode_cursor, encode_cursor
+from .payload import get_quiz_payload, quiz_version, quiz_version_key
+from .regrade import regrade_quiz
+from .rendering import rendered_cache, text_html
+from .search import search
+from .stats import item_analysis
 
 # Create your tests here.
 class CourseModelTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', password='password')
+
     def test_course_creation(self):
         course = Course.objects.create(
             title="Python Regular Expressions",
             description="Learn to write regular expressions in Python",
+            teacher=self.teacher,
         )
         now = timezone.now()
         self.assertLess(course.created_at, now)
@@ -18,29 +63,37 @@ class StepModelTests(TestCase):
     def setUp(self):
         self.course = Course.objects.create(
             title="Python Testing",
-            description="Learn to write tests in Python"
+            description="Learn to write tests in Python",
+            teacher=User.objects.create_user('teacher', password='password'),
         )
 
     def test_step_creation(self):
-        step = Step.objects.create(
+        step = Text.objects.create(
             title="Introduction to Doctests",
             description="Learn to write tests in your docstrings.",
             course=self.course
         )
-        self.assertIn(step, self.course.step_set.all())
+        self.assertIn(step, self.course.text_set.all())
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.step_count, 1)
 
 
 class CourseViewsTests(TestCase):
     def setUp(self):
+        teacher = User.objects.create_user('teacher', password='password')
         self.course = Course.objects.create(
             title="Python Testing",
             description="Learn to write tests in Python",
+            teacher=teacher,
+            published=True,
         )
         self.course2 = Course.objects.create(
             title="New Course",
             description="A new course",
+            teacher=teacher,
+            published=True,
         )
-        self.step = Step.objects.create(
+        self.step = Text.objects.create(
             title="Introduction to Doctests",
             description = "Learn to write tests in your docstrings",
             course = self.course
@@ -53,14 +106,1259 @@ class CourseViewsTests(TestCase):
         self.assertIn(self.course2, resp.context['courses'])
 
     def test_course_detail_view(self):
-        resp = self.client.get(reverse('courses:detail',
+        resp = self.client.get(reverse('courses:course detail view',
                                        kwargs={'pk': self.course.pk}))
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(self.course, resp.context['course'])
 
     def test_step_detail(self):
-        resp = self.client.get(reverse('courses:step', kwargs={
+        resp = self.client.get(reverse('courses:text detail view', kwargs={
             'course_pk': self.course.pk,
             'step_pk': self.step.pk}))
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(self.step, resp.context['step'])
+
+
+class CourseOutlineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='password')
+        self.course = Course.objects.create(
+            title="Python Testing",
+            description="Learn to write tests in Python",
+            teacher=self.teacher,
+            published=True,
+        )
+        self.quiz = Quiz.objects.create(title="Doctest Quiz", order=2, course=self.course)
+        self.text = Text.objects.create(title="Introduction to Doctests", order=1,
+                                        content="Long lecture notes", course=self.course)
+
+    def test_outline_is_ordered(self):
+        outline = get_course_outline(self.course.pk)
+        self.assertEqual([(entry.kind, entry.pk) for entry in outline],
+                         [('text', self.text.pk), ('quiz', self.quiz.pk)])
+        self.assertEqual(outline[0].url, self.text.get_absolute_url())
+
+    def test_outline_is_cached(self):
+        get_course_outline(self.course.pk)
+        with self.assertNumQueries(0):
+            get_course_outline(self.course.pk)
+
+    def test_outline_invalidated_on_save_and_delete(self):
+        get_course_outline(self.course.pk)
+        self.text.title = "Doctests"
+        self.text.save()
+        self.assertEqual(get_course_outline(self.course.pk)[0].title, "Doctests")
+        self.quiz.delete()
+        self.assertEqual(len(get_course_outline(self.course.pk)), 1)
+
+
+def make_quiz(course, num_questions, title="Quiz"):
+    '''Creates a quiz alternating MCQ and UIQ questions, returning correct form data'''
+    quiz = Quiz.objects.create(title=title, course=course)
+    data = {}
+    for order in range(num_questions):
+        if order % 2:
+            question = UserInputQuestion.objects.create(
+                quiz=quiz, order=order, prompt="g = ?", question_type='UIQ')
+            Answer.objects.create(question=question, text="9.81", correct=True)
+            data[str(question.pk)] = "9.81"
+        else:
+            question = MultipleChoiceQuestion.objects.create(
+                quiz=quiz, order=order, prompt="2 + 2 = ?", question_type='MCQ')
+            right = Answer.objects.create(question=question, order=1, text="4", correct=True)
+            Answer.objects.create(question=question, order=2, text="5")
+            data[str(question.pk)] = str(right.pk)
+    return quiz, data
+
+
+class GradingTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='password')
+        self.course = Course.objects.create(
+            title="Mechanics",
+            description="Forces",
+            teacher=self.student,
+            published=True,
+        )
+
+    def test_grade_submission(self):
+        quiz, data = make_quiz(self.course, 4)
+        key = AnswerKey.for_quiz(quiz.pk)
+        self.assertEqual(key.grade(data).correct_answers, 4)
+
+        wrong = dict(data)
+        mcq = key.questions[0]
+        wrong[str(mcq.pk)] = str(mcq.answers[1].pk)
+        wrong[str(key.questions[1].pk)] = "10"
+        result = key.grade(wrong)
+        self.assertEqual(result.correct_answers, 2)
+        self.assertEqual(result.graded[0].correct_answer.text, "4")
+
+    def test_missing_answer(self):
+        quiz, data = make_quiz(self.course, 2)
+        del data[next(iter(data))]
+        with self.assertRaises(IncompleteSubmission):
+            AnswerKey.for_quiz(quiz.pk).grade(data)
+
+    def test_query_count_constant(self):
+        '''Benchmark: grading and submitting cost the same queries for 5 or 40 questions'''
+        self.client.login(username='student', password='password')
+        counts = []
+        for size in (5, 40):
+            quiz, data = make_quiz(self.course, size, title="Quiz {}".format(size))
+            QuizTaker.objects.create(user=self.student, quiz=quiz)
+            with CaptureQueriesContext(connection) as grading:
+                self.assertEqual(AnswerKey.for_quiz(quiz.pk).grade(data).correct_answers, size)
+            with CaptureQueriesContext(connection) as submission:
+                self.client.post(reverse('courses:take_questions', args=(quiz.pk,)), data)
+            counts.append((len(grading), len(submission)))
+        self.assertEqual(counts[0], counts[1])
+
+
+class RenderedContentTests(TestCase):
+    def setUp(self):
+        rendered_cache.clear()
+        teacher = User.objects.create_user('teacher', password='password')
+        self.course = Course.objects.create(title="Waves", description="Optics", teacher=teacher)
+
+    def test_html_stored_on_save(self):
+        text = Text.objects.create(title="Lecture", content="# Heading", course=self.course)
+        self.assertIn("<h1>Heading</h1>", text.content_html)
+        self.assertEqual(text_html(text), text.content_html)
+        self.assertEqual(len(rendered_cache), 0)
+
+    def test_render_markdown_command(self):
+        text = Text.objects.create(title="Lecture", content="*notes*", course=self.course)
+        Text.objects.filter(pk=text.pk).update(content_html='', content_hash='')
+        call_command('render_markdown', workers=1, stdout=open(os.devnull, 'w'))
+        text.refresh_from_db()
+        self.assertIn("<em>notes</em>", text.content_html)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        teacher = User.objects.create_user('teacher', password='password')
+        self.course = Course.objects.create(title="Thermal Physics", description="Heat engines",
+                                            teacher=teacher, published=True)
+        self.hidden = Course.objects.create(title="Thermal Draft", description="Unpublished",
+                                            teacher=teacher)
+        self.text = Text.objects.create(title="Entropy", content="The Carnot cycle and entropy",
+                                        course=self.course)
+
+    def test_ranked_hits_in_published_courses(self):
+        hits = search("thermal")
+        self.assertEqual([(hit.kind, hit.pk) for hit in hits], [('course', self.course.pk)])
+        hits = search("carnot")
+        self.assertEqual(hits[0].pk, self.text.pk)
+        self.assertIn("<mark>Carnot</mark>", hits[0].snippet)
+
+    def test_index_follows_changes(self):
+        self.text.content = "Maxwell relations"
+        self.text.save()
+        self.assertEqual(search("carnot"), [])
+        self.assertEqual(len(search("maxwell")), 1)
+        self.text.delete()
+        self.assertEqual(search("maxwell"), [])
+
+    def test_search_view(self):
+        resp = self.client.get(reverse('courses:search'))
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.get(reverse('courses:search'), {'q': 'entropy'})
+        self.assertEqual(resp.context['hits'][0].title, "Entropy")
+        self.assertContains(resp, '<mark>entropy</mark>', count=1)
+        self.assertTemplateUsed(resp, 'courses/layout.html')
+
+
+class CatalogueTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', password='password')
+        self.courses = [
+            Course.objects.create(title="Course {}".format(number), description="Physics",
+                                  teacher=self.teacher, published=True)
+            for number in range(25)
+        ]
+
+    def test_step_count_follows_steps(self):
+        course = self.courses[0]
+        text = Text.objects.create(title="Notes", course=course)
+        Quiz.objects.create(title="Quiz", course=course)
+        course.refresh_from_db()
+        self.assertEqual(course.step_count, 2)
+        text.save()
+        text.delete()
+        course.refresh_from_db()
+        self.assertEqual(course.step_count, 1)
+
+    def test_keyset_pages(self):
+        resp = self.client.get(reverse('courses:course list view'))
+        first = resp.context['courses']
+        self.assertEqual(len(first), 20)
+        resp = self.client.get(reverse('courses:course list view'), {'after': resp.context['next_cursor']})
+        self.assertEqual(list(resp.context['courses']), self.courses[20:])
+        self.assertIsNone(resp.context['next_cursor'])
+
+    def test_malformed_cursor(self):
+        self.assertEqual(decode_cursor(encode_cursor([7])), [7])
+        self.assertIsNone(decode_cursor('not a cursor'))
+        resp = self.client.get(reverse('courses:by_teacher', args=['teacher']), {'after': '%%%'})
+        self.assertEqual(len(resp.context['courses']), 20)
+
+
+class QuizCounterTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='password')
+        self.course = Course.objects.create(title="Mechanics", description="Forces",
+                                            teacher=self.student, published=True)
+        self.quiz, self.data = make_quiz(self.course, 3)
+
+    def test_times_taken_counts_first_completion(self):
+        QuizTaker.objects.create(user=self.student, quiz=self.quiz)
+        self.client.login(username='student', password='password')
+        url = reverse('courses:take_questions', args=(self.quiz.pk,))
+        self.client.post(url, self.data)
+        self.client.post(url, self.data)
+        self.quiz.refresh_from_db()
+        self.assertEqual(self.quiz.times_taken, 1)
+
+    def test_retake_keeps_reconciled_count(self):
+        self.client.login(username='student', password='password')
+        take_url = reverse('courses:quiz detail view', args=(self.course.pk, self.quiz.pk))
+        questions_url = reverse('courses:take_questions', args=(self.quiz.pk,))
+        self.client.post(take_url, {'quiz_take_or_retake': 'take_quiz'})
+        self.client.post(questions_url, self.data)
+        self.client.post(take_url, {'quiz_take_or_retake': 'retake_quiz'})
+        self.client.post(questions_url, self.data)
+        self.quiz.refresh_from_db()
+        self.assertEqual(self.quiz.times_taken, 1)
+        call_command('reconcile_quiz_counters', stdout=open(os.devnull, 'w'))
+        self.quiz.refresh_from_db()
+        self.assertEqual(self.quiz.times_taken, 1)
+
+    def test_reconcile_quiz_counters(self):
+        QuizTaker.objects.create(user=self.student, quiz=self.quiz, completed=True)
+        call_command('reconcile_quiz_counters', stdout=open(os.devnull, 'w'))
+        self.quiz.refresh_from_db()
+        self.assertEqual((self.quiz.total_questions, self.quiz.times_taken), (3, 1))
+
+
+class AttemptAnswerTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='password')
+        self.course = Course.objects.create(title="Mechanics", description="Forces",
+                                            teacher=self.student, published=True)
+        self.quiz, self.data = make_quiz(self.course, 4)
+        self.attempt = QuizTaker.objects.create(user=self.student, quiz=self.quiz)
+        self.client.login(username='student', password='password')
+
+    def test_submission_is_stored_and_rerendered(self):
+        data = dict(self.data)
+        uiq = UserInputQuestion.objects.filter(quiz=self.quiz).first()
+        data[str(uiq.pk)] = "10"
+        self.client.post(reverse('courses:take_questions', args=(self.quiz.pk,)), data)
+        self.assertEqual(AttemptAnswer.objects.filter(attempt=self.attempt).count(), 4)
+        self.assertFalse(AttemptAnswer.objects.get(question=uiq).correct)
+
+        resp = self.client.get(reverse('courses:quiz_result', args=('student', self.quiz.pk)))
+        self.assertEqual(resp.status_code, 200)
+        result = resp.context['result']
+        self.assertEqual(result.correct_answers, 3)
+        self.assertEqual([item.your_answer for item in result if item.question.pk == uiq.pk], ["10"])
+        self.assertContains(resp, "Your Answer: 10")
+
+    def test_free_text_questions_take_typed_answers(self):
+        uiq = UserInputQuestion.objects.filter(quiz=self.quiz).first()
+        resp = self.client.get(reverse('courses:take_questions', args=(self.quiz.pk,)))
+        self.assertContains(resp, 'type="text" name="{}"'.format(uiq.pk))
+        self.assertEqual(resp.content.decode().count('type="text"'), 2)
+
+    def test_resubmission_replaces_answers(self):
+        url = reverse('courses:take_questions', args=(self.quiz.pk,))
+        self.client.post(url, self.data)
+        self.client.post(url, self.data)
+        self.assertEqual(AttemptAnswer.objects.filter(attempt=self.attempt).count(), 4)
+
+    def test_results_are_private(self):
+        User.objects.create_user('other', password='password')
+        self.client.login(username='other', password='password')
+        resp = self.client.get(reverse('courses:quiz_result', args=('student', self.quiz.pk)))
+        self.assertEqual(resp.status_code, 404)
+
+
+class QuestionStatisticsTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='password')
+        self.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        self.course = Course.objects.create(title="Mechanics", description="Forces",
+                                            teacher=self.staff, published=True)
+        self.quiz, self.data = make_quiz(self.course, 2)
+        self.mcq = MultipleChoiceQuestion.objects.get(quiz=self.quiz)
+        self.wrong = self.mcq.answer_set.get(correct=False)
+        QuizTaker.objects.create(user=self.student, quiz=self.quiz)
+        self.client.login(username='student', password='password')
+
+    def submit(self, data):
+        self.client.post(reverse('courses:take_questions', args=(self.quiz.pk,)), data)
+
+    def test_statistics_updated_on_submission(self):
+        self.submit(self.data)
+        data = dict(self.data)
+        data[str(self.mcq.pk)] = str(self.wrong.pk)
+        self.submit(data)
+        statistic = QuestionStatistic.objects.get(question=self.mcq)
+        self.assertEqual((statistic.responses, statistic.correct), (1, 0))
+        self.assertEqual(AnswerStatistic.objects.get(answer=self.wrong).chosen, 1)
+
+    def test_retake_removes_previous_responses(self):
+        self.submit(self.data)
+        start_attempt(self.student, self.quiz.pk, retake=True)
+        data = dict(self.data)
+        data[str(self.mcq.pk)] = str(self.wrong.pk)
+        self.submit(data)
+        item = next(item for item in item_analysis(self.quiz.pk) if item.question.pk == self.mcq.pk)
+        self.assertEqual((item.responses, item.correct), (1, 0))
+        self.assertEqual([answer.chosen for answer in item.answers if answer.answer.pk == self.wrong.pk], [1])
+
+    def test_rebuild_matches_incremental(self):
+        self.submit(self.data)
+        expected = list(QuestionStatistic.objects.order_by('pk').values_list('pk', 'responses', 'correct'))
+        QuestionStatistic.objects.all().delete()
+        call_command('rebuild_question_statistics', stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(QuestionStatistic.objects.order_by('pk').values_list('pk', 'responses', 'correct')),
+                         expected)
+
+    def test_statistics_view_is_staff_only(self):
+        url = reverse('courses:quiz_statistics', args=(self.quiz.pk,))
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.submit(self.data)
+        self.client.login(username='staff', password='password')
+        resp = self.client.get(url)
+        self.assertEqual(resp.context['items'][0].facility, 100)
+
+
+class StepVideoTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        teacher = User.objects.create_user('teacher', password='password')
+        self.course = Course.objects.create(title="Waves", description="Optics",
+                                            teacher=teacher, published=True)
+        self.text = Text(title="Lecture", course=self.course)
+        self.text.video_file.save('lecture.mp4', ContentFile(bytes(range(256)) * 4))
+        self.url = reverse('courses:step video', args=(self.course.pk, self.text.pk))
+
+    def test_full_file(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(b''.join(resp.streaming_content)), 1024)
+        self.assertEqual(resp['Accept-Ranges'], 'bytes')
+
+    def test_range_request(self):
+        resp = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(resp.streaming_content), bytes(range(10, 20)))
+        resp = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(resp.streaming_content), bytes(range(252, 256)))
+        resp = self.client.get(self.url, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(resp.status_code, 416)
+
+    def test_conditional_request(self):
+        etag = self.client.get(self.url)['ETag']
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+    def test_unpublished_course(self):
+        Course.objects.filter(pk=self.course.pk).update(published=False)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class VideoUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root,
+                                              VIDEO_UPLOAD_DIR=os.path.join(self.media_root, 'uploads'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        course = Course.objects.create(title="Waves", description="Optics", teacher=self.staff)
+        self.text = Text.objects.create(title="Lecture", course=course)
+        self.client.login(username='staff', password='password')
+        self.video = os.urandom(3000)
+
+    def start(self, **extra):
+        data = {'step': self.text.pk, 'filename': 'lecture.mp4', 'size': len(self.video)}
+        data.update(extra)
+        resp = self.client.post(reverse('courses:video_upload_create'), data)
+        self.assertEqual(resp.status_code, 201)
+        return reverse('courses:video_upload_detail', args=(resp.json()['id'],))
+
+    def put(self, url, start, end, **headers):
+        return self.client.put(url, self.video[start:end + 1], content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE='bytes {}-{}/{}'.format(start, end, len(self.video)),
+                               **headers)
+
+    def test_resumable_upload(self):
+        url = self.start(checksum=hashlib.sha256(self.video).hexdigest())
+        self.assertEqual(self.put(url, 0, 999).json()['offset'], 1000)
+        # a chunk resent after a dropped response is rejected with the offset to resume from
+        resp = self.put(url, 0, 999)
+        self.assertEqual((resp.status_code, resp.json()['offset']), (409, 1000))
+        self.assertEqual(self.client.get(url).json()['offset'], 1000)
+
+        resp = self.put(url, 1000, 2999)
+        self.assertTrue(resp.json()['completed'])
+        self.text.refresh_from_db()
+        with self.text.video_file.open('rb') as f:
+            self.assertEqual(f.read(), self.video)
+
+    def test_chunk_checksum(self):
+        url = self.start()
+        resp = self.put(url, 0, 999, HTTP_X_CHUNK_SHA256='0' * 64)
+        self.assertEqual(resp.status_code, 422)
+        self.assertEqual(VideoUpload.objects.get().offset, 0)
+
+    def test_clean_stale_uploads(self):
+        url = self.start()
+        self.put(url, 0, 999)
+        VideoUpload.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        call_command('clean_stale_uploads', stdout=open(os.devnull, 'w'))
+        self.assertFalse(VideoUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads')), [])
+
+
+class StepSidebarTests(TestCase):
+    template = Template("{% load course_extras %}{% step_sidebar course step %}")
+
+    def setUp(self):
+        cache.clear()
+        teacher = User.objects.create_user('teacher', password='password')
+        self.course = Course.objects.create(title="Waves", description="Optics",
+                                            teacher=teacher, published=True)
+        self.text = Text.objects.create(title="Interference", order=1, course=self.course)
+        self.quiz = Quiz.objects.create(title="Diffraction Quiz", order=2, course=self.course)
+
+    def render(self, step):
+        return self.template.render(Context({'course': self.course, 'step': step}))
+
+    def test_fragment_reused_across_current_steps(self):
+        self.render(self.text)
+        with self.assertNumQueries(0):
+            html = self.render(self.quiz)
+        self.assertIn(self.text.get_absolute_url(), html)
+        self.assertIn("#step-quiz-{} a".format(self.quiz.pk), html)
+
+    def test_fragment_rebuilt_on_content_change(self):
+        self.render(self.text)
+        self.text.title = "Superposition"
+        self.text.save()
+        self.assertIn("Superposition", self.render(self.text))
+
+
+class CatalogueTagTests(TestCase):
+    template = Template("{% load course_extras %}{% newest_course as newest %}{{ newest.title }}|{% nav_courses_list %}")
+
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='password')
+
+    def render(self):
+        return self.template.render(Context())
+
+    def test_empty_catalogue(self):
+        self.assertTrue(self.render().startswith('|'))
+
+    def test_served_from_cache(self):
+        Course.objects.create(title="Optics", description="Light", teacher=self.teacher, published=True)
+        self.render()
+        with self.assertNumQueries(0):
+            self.assertIn("Optics", self.render())
+
+    def test_invalidated_by_publishing(self):
+        course = Course.objects.create(title="Optics", description="Light", teacher=self.teacher)
+        self.assertNotIn("Optics", self.render())
+        course = Course.objects.get(pk=course.pk)
+        course.published = True
+        course.save()
+        self.assertTrue(self.render().startswith("Optics|"))
+        course.delete()
+        self.assertNotIn("Optics", self.render())
+
+    def test_unrelated_save_keeps_cache(self):
+        Course.objects.create(title="Optics", description="Light", teacher=self.teacher, published=True)
+        self.render()
+        course = Course.objects.get()
+        course.description = "Lenses"
+        course.save()
+        with self.assertNumQueries(0):
+            self.render()
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.log_file = os.path.join(self.directory, 'requests.jsonl')
+        # drop whatever earlier tests recorded
+        with self.settings(PERF_LOG_FILE=None):
+            recorder.flush()
+        teacher = User.objects.create_user('teacher', password='password')
+        self.course = Course.objects.create(title="Optics", description="Light",
+                                            teacher=teacher, published=True)
+
+    def test_histogram_percentiles(self):
+        histogram = Histogram()
+        for value in range(1, 101):
+            histogram.add(value)
+        self.assertAlmostEqual(histogram.percentile(50), 50, delta=5)
+        self.assertAlmostEqual(histogram.percentile(99), 99, delta=5)
+        self.assertEqual(histogram.percentile(100), 100)
+
+    def test_requests_recorded_per_view(self):
+        with self.settings(PERF_LOG_FILE=self.log_file):
+            for _ in range(3):
+                self.client.get(reverse('courses:course list view'))
+            self.client.get(reverse('courses:course detail view', kwargs={'pk': self.course.pk}))
+            recorder.flush()
+
+        views = read_log(self.log_file)
+        course_list = views['courses:course list view']
+        self.assertEqual(course_list['total_ms'].count, 3)
+        self.assertGreater(course_list['queries'].min, 0)
+        self.assertGreater(course_list['template_ms'].max, 0)
+        self.assertGreater(course_list['bytes'].min, 0)
+        self.assertEqual(views['courses:course detail view']['total_ms'].count, 1)
+
+        out = StringIO()
+        call_command('perf_report', file=self.log_file, stdout=out)
+        self.assertIn('courses:course list view (3 requests)', out.getvalue())
+        self.assertIn('p95', out.getvalue())
+
+    async def test_async_requests_recorded(self):
+        with self.settings(PERF_LOG_FILE=self.log_file):
+            await self.async_client.get(reverse('courses:course list view'))
+            recorder.flush()
+        course_list = read_log(self.log_file)['courses:course list view']
+        self.assertEqual(course_list['total_ms'].count, 1)
+        self.assertGreater(course_list['queries'].min, 0)
+        self.assertGreater(course_list['template_ms'].max, 0)
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_seed_and_bench(self):
+        call_command('seed_benchmark_data', courses=3, texts=2, quizzes=2, questions=6,
+                     teachers=1, users=4, attempts=2, stdout=StringIO())
+        self.assertEqual(Course.objects.count(), 3)
+        self.assertEqual(Course.objects.first().step_count, 4)
+        # every question has its multi-table child row
+        self.assertEqual(
+            MultipleChoiceQuestion.objects.count() + TrueFalseQuestion.objects.count()
+            + UserInputQuestion.objects.count(), 36)
+        self.assertEqual(QuizTaker.objects.filter(completed=True).count(), 8)
+        self.assertEqual(sum(Quiz.objects.values_list('times_taken', flat=True)), 8)
+        self.assertEqual(AttemptAnswer.objects.count(), 8 * 6)
+
+        out = StringIO()
+        call_command('bench_views', iterations=2, warmup=0, no_check=True, stdout=out)
+        self.assertIn('courses:take_questions (submit)', out.getvalue())
+        self.assertIn('courses:api_quiz_submit', out.getvalue())
+        # the run leaves no trace behind
+        self.assertEqual(QuizTaker.objects.count(), 8)
+
+
+@override_settings(DATABASE_LOCK_RETRIES=2, DATABASE_LOCK_BACKOFF=0)
+class LockRetryTests(TransactionTestCase):
+    def flaky(self, failures, message='database is locked'):
+        calls = []
+
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return len(calls)
+        return write
+
+    def test_retries_until_unlocked(self):
+        self.assertEqual(retry_on_lock(self.flaky(2))(), 3)
+
+    def test_gives_up_after_retries(self):
+        with self.assertRaises(OperationalError):
+            retry_on_lock(self.flaky(3))()
+
+    def test_other_errors_not_retried(self):
+        with self.assertRaises(OperationalError):
+            retry_on_lock(self.flaky(1, 'no such table: courses_quiz'))()
+
+    def test_not_retried_inside_transaction(self):
+        with self.assertRaises(OperationalError), transaction.atomic():
+            retry_on_lock(self.flaky(1))()
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -2048})
+    def test_pragmas_applied(self):
+        configure_sqlite(connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -2048)
+
+
+class AsyncCatalogueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        teacher = User.objects.create_user('teacher', password='password')
+        self.course = Course.objects.create(title="Waves", description="Optics",
+                                            teacher=teacher, published=True)
+        self.draft = Course.objects.create(title="Draft", description="Unpublished", teacher=teacher)
+        self.text = Text.objects.create(title="Interference", content="Young's double slit",
+                                        order=1, course=self.course)
+        self.quiz = Quiz.objects.create(title="Diffraction Quiz", order=2, course=self.course)
+
+    def request(self, params=None):
+        request = AsyncRequestFactory().get('/', params)
+
+        async def anonymous():
+            return AnonymousUser()
+        request.auser = anonymous
+        return request
+
+    # a synchronous query while rendering would raise SynchronousOnlyOperation
+
+    async def test_course_list(self):
+        response = await async_views.course_list(self.request())
+        self.assertContains(response, "Waves")
+        self.assertNotContains(response, "Draft")
+
+    async def test_course_detail(self):
+        response = await async_views.course_detail(self.request(), self.course.pk)
+        self.assertContains(response, self.quiz.get_absolute_url())
+        with self.assertRaises(Http404):
+            await async_views.course_detail(self.request(), self.draft.pk)
+
+    async def test_text_detail(self):
+        response = await async_views.text_detail(self.request(), self.course.pk, self.text.pk)
+        self.assertContains(response, "<h1>Interference</h1>", html=True)
+        self.assertContains(response, "#step-text-{} a".format(self.text.pk))
+        self.assertContains(response, self.quiz.get_absolute_url())
+
+    async def test_outline_uses_async_cache(self):
+        def off_event_loop(method):
+            def wrapper(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    return method(*args, **kwargs)
+                raise AssertionError('blocking cache call on the event loop')
+            return wrapper
+
+        with mock.patch.multiple(cache, get=off_event_loop(cache.get), set=off_event_loop(cache.set),
+                                 add=off_event_loop(cache.add)):
+            outline = await aget_course_outline(self.course.pk)
+            self.assertEqual(await aget_course_outline(self.course.pk), outline)
+            # the sidebar fragment, built on a miss and read on a hit
+            for _ in range(2):
+                response = await async_views.text_detail(self.request(), self.course.pk, self.text.pk)
+                self.assertContains(response, self.quiz.get_absolute_url())
+        self.assertEqual([entry.pk for entry in outline.entries], [self.text.pk, self.quiz.pk])
+
+        # the sync views' {% cache %} tag reads the fragment stored by the async path
+        def render_sidebar():
+            with self.assertNumQueries(0):
+                return Template("{% load course_extras %}{% step_sidebar course %}").render(
+                    Context({'course': self.course}))
+        self.assertIn(self.quiz.get_absolute_url(), await sync_to_async(render_sidebar)())
+
+    async def test_courses_by_teacher(self):
+        response = await async_views.courses_by_teacher(self.request(), 'teacher')
+        self.assertContains(response, "Waves")
+
+    async def test_search(self):
+        response = await async_views.search(self.request({'q': 'slit'}))
+        self.assertContains(response, "<mark>slit</mark>")
+
+
+class FailingEmailBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionRefusedError('mail server down')
+
+
+class OutboxTests(TestCase):
+    def test_suggestion_is_queued_not_sent(self):
+        resp = self.client.post(reverse('suggestion view'), {
+            'name': 'Ada',
+            'email': 'ada@example.com',
+            'verify_email': 'ada@example.com',
+            'suggestion': 'More optics please',
+        })
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.from_email, 'Ada <ada@example.com>')
+
+        call_command('process_outbox', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].body, 'More optics please')
+        message.refresh_from_db()
+        self.assertIsNotNone(message.sent_at)
+        # nothing is sent twice
+        self.assertEqual(deliver_batch(), (0, 0))
+
+    @override_settings(EMAIL_BACKEND='courses.tests.FailingEmailBackend', OUTBOX_MAX_ATTEMPTS=2)
+    def test_failures_back_off_then_give_up(self):
+        message = enqueue_mail('Hello', 'Body', 'a@example.com', ['b@example.com', 'c@example.com'])
+        self.assertEqual(deliver_batch(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('mail server down', message.last_error)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        # not due yet
+        self.assertEqual(deliver_batch(), (0, 0))
+
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_batch(), (0, 1))
+        message.refresh_from_db()
+        self.assertIsNone(message.next_attempt_at)
+        self.assertIsNone(message.sent_at)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginTests(TestCase):
+    def setUp(self):
+        User.objects.create_user('student', password='password')
+
+    def test_login_hashes_password_once(self):
+        with HashCounter() as counter:
+            resp = self.client.post(reverse('login_view'), {'username': 'student', 'password': 'password'})
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(counter.calls, 1)
+        self.assertEqual(int(self.client.session['_auth_user_id']), User.objects.get().pk)
+
+    def test_wrong_password(self):
+        with HashCounter() as counter:
+            resp = self.client.post(reverse('login_view'), {'username': 'student', 'password': 'wrong'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(counter.calls, 1)
+        self.assertContains(resp, 'Incorrect username or password')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_bench_login(self):
+        out = StringIO()
+        call_command('bench_login', logins=2, stdout=out)
+        self.assertIn('hashes per login: 1', out.getvalue())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EnrollmentTests(TestCase):
+    def setUp(self):
+        User.objects.create_user('taken', email='taken@example.com', password='password')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_csv(self, rows):
+        path = os.path.join(self.directory, 'cohort.csv')
+        with open(path, 'w') as file:
+            file.write('username,email,first_name,last_name,password\n')
+            file.writelines(row + '\n' for row in rows)
+        return path
+
+    def test_enroll_cohort(self):
+        path = self.write_csv(['s{0},s{0}@example.com,Student,{0},pw{0}'.format(i) for i in range(5)])
+        with self.assertNumQueries(7):
+            # preload usernames and emails, then a savepoint around one INSERT per batch of two
+            call_command('enroll_cohort', path, batch_size=2, processes=2, stdout=StringIO())
+        user = User.objects.get(username='s3')
+        self.assertEqual(user.email, 's3@example.com')
+        self.assertTrue(user.check_password('pw3'))
+        self.assertEqual(User.objects.count(), 6)
+
+    def test_invalid_rows(self):
+        path = self.write_csv([
+            'new,new@example.com,A,B,pw',
+            'taken,other@example.com,A,B,pw',
+            'other,taken@example.com,A,B,pw',
+            'again,new@example.com,A,B,pw',
+            'nopassword,np@example.com,A,B,',
+            'bad,not-an-email,A,B,pw',
+        ])
+        err = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('enroll_cohort', path, stderr=err)
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(len(err.getvalue().splitlines()), 5)
+
+        call_command('enroll_cohort', path, skip_invalid=True, processes=1, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(list(User.objects.order_by('pk').values_list('username', flat=True)), ['taken', 'new'])
+
+    def test_email_index(self):
+        User.objects.create_user('blank1')
+        User.objects.create_user('blank2')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user('duplicate', email='taken@example.com')
+
+    def test_registration_email_check_uses_index(self):
+        sql, params = users_with_email('taken@example.com').values('pk')[:1].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('USING COVERING INDEX {}'.format(EMAIL_INDEX), plan)
+        self.assertTrue(users_with_email('taken@example.com').exists())
+        form = UserRegisterForm(data={'username': 'new', 'first_name': 'A', 'last_name': 'B', 'password': 'pw',
+                                      'email': 'taken@example.com', 'email2': 'taken@example.com'})
+        self.assertEqual(form.non_field_errors(), ['This email is already taken'])
+
+    def test_email_index_with_duplicates(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX {}'.format(EMAIL_INDEX))
+        User.objects.create_user('duplicate', email='taken@example.com')
+        with self.assertLogs('courses.enrollment', 'WARNING') as logs:
+            self.assertFalse(create_email_index())
+        self.assertIn('taken@example.com', logs.output[0])
+        # the failed CREATE INDEX leaves the surrounding transaction usable
+        self.assertEqual(User.objects.filter(email='taken@example.com').count(), 2)
+
+
+class QuizInterchangeTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        self.course = Course.objects.create(title="Mechanics", description="Forces",
+                                            teacher=self.staff, published=True)
+        self.quiz, self.data = make_quiz(self.course, 4, title="Kinematics")
+        question = TrueFalseQuestion.objects.create(quiz=self.quiz, order=4, prompt="g > 0", question_type='TFQ')
+        Answer.objects.create(question=question, order=0, text="True", correct=True)
+        Answer.objects.create(question=question, order=1, text="False")
+
+    def round_trip(self, format, **overrides):
+        text = ''.join(export_quiz(self.quiz, format))
+        data = read_quiz(StringIO(text), format)
+        data.update(overrides)
+        return import_quiz(self.course, data)
+
+    def assertSameQuiz(self, copy):
+        def contents(quiz):
+            return [(question.question_type, question.order, question.prompt,
+                     [(answer.order, answer.text, answer.correct) for answer in question.answer_set.all()])
+                    for question in Question.objects.filter(quiz=quiz).prefetch_related('answer_set')]
+        self.assertEqual(contents(copy), contents(self.quiz))
+        self.assertEqual(copy.total_questions, 5)
+        self.assertEqual(MultipleChoiceQuestion.objects.filter(quiz=copy).count(), 2)
+        self.assertEqual(TrueFalseQuestion.objects.filter(quiz=copy).count(), 1)
+        # the copy grades like the original
+        self.assertEqual(AnswerKey.for_quiz(copy.pk).grade({
+            str(question.pk): question.correct_answer.text if question.question_type == 'UIQ'
+            else str(question.correct_answer.pk)
+            for question in AnswerKey.for_quiz(copy.pk)
+        }).correct_answers, 5)
+
+    def test_json_round_trip(self):
+        copy = self.round_trip('json')
+        self.assertEqual(copy.title, "Kinematics")
+        self.assertSameQuiz(copy)
+
+    def test_csv_round_trip(self):
+        copy = self.round_trip('csv', title="Kinematics (copy)")
+        self.assertSameQuiz(copy)
+        self.assertEqual(self.course.quiz_set.count(), 2)
+
+    def test_import_queries_do_not_grow(self):
+        text = ''.join(export_quiz(self.quiz, 'json'))
+        counts = []
+        for copies in (1, 20):
+            data = read_quiz(StringIO(text), 'json')
+            data['questions'] = data['questions'] * copies
+            with CaptureQueriesContext(connection) as queries:
+                import_quiz(self.course, data)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_invalid_files(self):
+        with self.assertRaises(QuizFormatError):
+            read_quiz(StringIO('{"format": 1, "quiz": {}, "questions": [{"type": "XYZ", "prompt": "?"}]}'), 'json')
+        with self.assertRaises(QuizFormatError):
+            read_quiz(StringIO('question,type\n1,MCQ\n'), 'csv')
+        with self.assertRaises(QuizFormatError):
+            self.round_trip('csv')  # CSV files carry no title
+
+    def test_malformed_json(self):
+        question = '{"type": "MCQ", "prompt": "?", "answers": %s}'
+        for text, message in [
+            ('{"format": 1, "quiz": ["Kinematics"], "questions": []}', '"quiz" is not an object'),
+            ('{"format": 1, "quiz": {}, "questions": {"1": {}}}', '"questions" is not a list'),
+            ('{"format": 1, "questions": [%s]}' % (question % '"yes"'), 'Question 1 "answers" is not a list'),
+            ('{"format": 1, "questions": [%s]}' % (question % '[{"text": "a"}, "b"]'),
+             'Question 1 answer 2 is not an object'),
+        ]:
+            with self.subTest(text=text), self.assertRaisesMessage(QuizFormatError, message):
+                read_quiz(StringIO(text), 'json')
+
+        self.client.login(username='staff', password='password')
+        upload = SimpleUploadedFile('malformed.json', (
+            '{"format": 1, "quiz": {"title": "Broken"}, "questions": [%s]}' % (question % '["a", "b"]')).encode())
+        resp = self.client.post(reverse('courses:import_quiz', args=(self.course.pk,)), {'file': upload})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('answer 1 is not an object', resp.json()['errors']['file'][0])
+
+    def test_endpoints(self):
+        export_url = reverse('courses:export_quiz', args=(self.course.pk, self.quiz.pk))
+        import_url = reverse('courses:import_quiz', args=(self.course.pk,))
+        self.assertEqual(self.client.get(export_url).status_code, 302)
+
+        self.client.login(username='staff', password='password')
+        resp = self.client.get(export_url + '?format=csv')
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp['Content-Type'], 'text/csv')
+        upload = SimpleUploadedFile('kinematics.csv', b''.join(resp.streaming_content))
+
+        resp = self.client.post(import_url, {'file': upload, 'title': 'Imported'})
+        self.assertEqual(resp.status_code, 201)
+        copy = Quiz.objects.get(pk=resp.json()['id'])
+        self.assertEqual(copy.title, 'Imported')
+        self.assertSameQuiz(copy)
+
+        upload = SimpleUploadedFile('broken.json', b'{"format": 1')
+        resp = self.client.post(import_url, {'file': upload})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('Invalid JSON', resp.json()['errors']['file'][0])
+
+    def test_commands(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'quiz.json')
+        call_command('export_quiz', self.quiz.pk, output=path)
+        out = StringIO()
+        call_command('import_quiz', self.course.pk, path, stdout=out)
+        self.assertIn('with 5 questions', out.getvalue())
+        self.assertSameQuiz(Quiz.objects.latest('pk'))
+
+
+class QuestionTypeTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        self.course = Course.objects.create(title="Mechanics", description="Forces",
+                                            teacher=self.staff, published=True)
+        self.quiz, self.data = make_quiz(self.course, 2)
+        self.tfq = TrueFalseQuestion.objects.create(quiz=self.quiz, order=2, prompt="g > 0", question_type='TFQ')
+
+    def test_concrete_questions_in_one_query(self):
+        with self.assertNumQueries(1):
+            questions = question_types.concrete_questions(self.quiz.pk)
+            self.assertEqual([type(question) for question in questions],
+                             [MultipleChoiceQuestion, UserInputQuestion, TrueFalseQuestion])
+            self.assertFalse(questions[0].shuffle_answers)
+
+    def test_registry(self):
+        self.assertIs(question_types.for_slug('tf').model, TrueFalseQuestion)
+        self.assertIsNone(question_types.for_slug('xx'))
+        self.assertTrue(question_types.get_type('UIQ').free_text)
+        self.assertIs(question_types.for_model(MultipleChoiceQuestion).form_class,
+                      question_types.get_type('MCQ').form_class)
+
+    def test_question_views(self):
+        self.client.login(username='staff', password='password')
+        for question in question_types.concrete_questions(self.quiz.pk):
+            resp = self.client.get(reverse('courses:edit_question', args=(self.quiz.pk, question.pk)))
+            self.assertEqual(resp.status_code, 200)
+            self.assertIsInstance(resp.context['form'], question_types.for_model(type(question)).form_class)
+        resp = self.client.get(reverse('courses:create_question', args=(self.quiz.pk, 'xx')))
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get(reverse('courses:create_question', args=(self.quiz.pk, 'tf')))
+        self.assertIsInstance(resp.context['form'], question_types.get_type('TFQ').form_class)
+
+    def test_failed_question_save_keeps_count(self):
+        self.client.login(username='staff', password='password')
+        prefix = self.client.get(
+            reverse('courses:create_question', args=(self.quiz.pk, 'tf'))).context['formset'].prefix
+        data = {'order': 3, 'question_type': 'TFQ', 'prompt': "g < 0",
+                prefix + '-TOTAL_FORMS': 1, prefix + '-INITIAL_FORMS': 0,
+                prefix + '-0-order': 0, prefix + '-0-text': "False", prefix + '-0-correct': 'on'}
+        total = Quiz.objects.get(pk=self.quiz.pk).total_questions
+        with mock.patch.object(Answer, 'save', side_effect=IntegrityError), self.assertRaises(IntegrityError):
+            self.client.post(reverse('courses:create_question', args=(self.quiz.pk, 'tf')), data)
+        self.assertEqual(Quiz.objects.get(pk=self.quiz.pk).total_questions, total)
+        self.client.post(reverse('courses:create_question', args=(self.quiz.pk, 'tf')), data)
+        self.assertEqual(Quiz.objects.get(pk=self.quiz.pk).total_questions, total + 1)
+
+
+class AnswerShuffleTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='password')
+        self.course = Course.objects.create(title="Mechanics", description="Forces",
+                                            teacher=self.student, published=True)
+        self.quiz = Quiz.objects.create(title="Quiz", course=self.course)
+        self.question = MultipleChoiceQuestion.objects.create(
+            quiz=self.quiz, prompt="Pick", question_type='MCQ', shuffle_answers=True)
+        self.fixed = MultipleChoiceQuestion.objects.create(
+            quiz=self.quiz, order=1, prompt="Fixed", question_type='MCQ')
+        for question in (self.question, self.fixed):
+            for order in range(8):
+                Answer.objects.create(question=question, order=order, text="A{}".format(order), correct=not order)
+        self.client.login(username='student', password='password')
+
+    def shown_order(self, question):
+        resp = self.client.get(reverse('courses:take_questions', args=(self.quiz.pk,)))
+        shown = next(item for item in resp.context['questions'] if item.pk == question.pk)
+        return [answer.text for answer in shown.answers]
+
+    def test_shuffle_is_seeded_by_attempt(self):
+        attempt = QuizTaker.objects.create(user=self.student, quiz=self.quiz)
+        key = AnswerKey.for_quiz(self.quiz.pk)
+        first = [answer.text for answer in key.shuffled_for(attempt)[0].answers]
+        self.assertEqual(self.shown_order(self.question), first)
+        self.assertEqual(self.shown_order(self.question), first)
+        self.assertNotEqual(first, ["A{}".format(order) for order in range(8)])
+        self.assertEqual(self.shown_order(self.fixed), ["A{}".format(order) for order in range(8)])
+
+        expected = ["A{}".format(order) for order in range(8)]
+        random.Random('{}:{}'.format(attempt.pk, self.question.pk)).shuffle(expected)
+        self.assertEqual(first, expected)
+
+        # grading does not depend on the order shown
+        data = {str(self.question.pk): str(key.questions[0].correct_answer.pk),
+                str(self.fixed.pk): str(key.questions[1].correct_answer.pk)}
+        self.assertEqual(key.grade(data).correct_answers, 2)
+
+    def test_no_extra_queries(self):
+        QuizTaker.objects.create(user=self.student, quiz=self.quiz)
+        url = reverse('courses:take_questions', args=(self.quiz.pk,))
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as shuffled:
+            self.client.get(url)
+        MultipleChoiceQuestion.objects.update(shuffle_answers=False)
+        with CaptureQueriesContext(connection) as unshuffled:
+            self.client.get(url)
+        self.assertEqual(len(shuffled), len(unshuffled))
+
+
+class QuizPayloadTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='password')
+        self.course = Course.objects.create(title="Mechanics", description="Forces",
+                                            teacher=self.student, published=True)
+        self.quiz, self.data = make_quiz(self.course, 4)
+        QuizTaker.objects.create(user=self.student, quiz=self.quiz)
+        self.client.login(username='student', password='password')
+
+    def test_warm_page_reads_no_quiz_content(self):
+        url = reverse('courses:take_questions', args=(self.quiz.pk,))
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+        self.assertContains(resp, "2 + 2 = ?")
+        tables = [Quiz._meta.db_table, Question._meta.db_table, Answer._meta.db_table, Course._meta.db_table]
+        sql = ' '.join(query['sql'] for query in queries)
+        for table in tables:
+            self.assertNotIn('"{}"'.format(table), sql)
+        # session, user and the attempt
+        self.assertEqual(len(queries), 3)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_quiz_payload(self.quiz.pk).key.grade(self.data).correct_answers, 4)
+
+    def test_edits_bump_version(self):
+        version = quiz_version(self.quiz.pk)
+        payload = get_quiz_payload(self.quiz.pk)
+        self.assertEqual(payload.version, version)
+
+        answer = Answer.objects.get(question_id=payload.key.questions[0].pk, correct=True)
+        answer.text = "four"
+        answer.save()
+        payload = get_quiz_payload(self.quiz.pk)
+        self.assertGreater(payload.version, version)
+        self.assertEqual(payload.key.questions[0].correct_answer.text, "four")
+
+        version = payload.version
+        MultipleChoiceQuestion.objects.filter(quiz=self.quiz).first().delete()
+        payload = get_quiz_payload(self.quiz.pk)
+        self.assertGreater(payload.version, version)
+        self.assertEqual(len(payload.key), 3)
+
+        self.course.title = "Classical Mechanics"
+        self.course.save()
+        self.assertEqual(get_quiz_payload(self.quiz.pk).quiz.course.title, "Classical Mechanics")
+
+    def test_missing_quiz(self):
+        self.assertIsNone(get_quiz_payload(self.quiz.pk + 100))
+        resp = self.client.get(reverse('courses:take_questions', args=(self.quiz.pk + 100,)))
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get(reverse('courses:api_quiz_content', args=(self.quiz.pk + 100,)))
+        self.assertEqual(resp.status_code, 404)
+        # requests for quizzes that do not exist leave no version keys behind
+        self.assertIsNone(cache.get(quiz_version_key(self.quiz.pk + 100)))
+
+    def test_deleted_quiz_drops_version_key(self):
+        get_quiz_payload(self.quiz.pk)
+        self.assertIsNotNone(cache.get(quiz_version_key(self.quiz.pk)))
+        pk = self.quiz.pk
+        self.quiz.delete()
+        self.assertIsNone(cache.get(quiz_version_key(pk)))
+        self.assertIsNone(get_quiz_payload(pk))
+
+
+class QuizApiTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='password')
+        self.course = Course.objects.create(title="Mechanics", description="Forces",
+                                            teacher=self.student, published=True)
+        self.quiz, self.data = make_quiz(self.course, 4)
+        MultipleChoiceQuestion.objects.filter(quiz=self.quiz).update(shuffle_answers=True)
+        self.quiz.save()  # the bulk update above sends no signals
+        self.content_url = reverse('courses:api_quiz_content', args=(self.quiz.pk,))
+        self.attempt_url = reverse('courses:api_quiz_attempt', args=(self.quiz.pk,))
+        self.submit_url = reverse('courses:api_quiz_submit', args=(self.quiz.pk,))
+        self.client.login(username='student', password='password')
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_content(self):
+        resp = self.client.get(self.content_url)
+        self.assertEqual(resp.status_code, 200)
+        content = resp.json()
+        self.assertEqual([question['text'] for question in content['questions']], [False, True, False, True])
+        self.assertEqual(len(content['questions'][0]['answers']), 2)
+        # no answer key and no whitespace
+        self.assertNotIn(b'correct', resp.content)
+        self.assertNotIn(b', ', resp.content)
+
+        resp = self.client.get(self.content_url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 304)
+        Answer.objects.filter(question__quiz=self.quiz).first().save()
+        resp = self.client.get(self.content_url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.client.get(self.content_url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+
+    def test_attempt_and_submit(self):
+        resp = self.post(self.submit_url, {'answers': self.data})
+        self.assertEqual(resp.status_code, 409)
+
+        attempt = self.post(self.attempt_url, {}).json()
+        self.assertFalse(attempt['completed'])
+        taker = QuizTaker.objects.get(pk=attempt['id'])
+        key = AnswerKey.for_quiz(self.quiz.pk)
+        expected = {str(question.pk): [answer.pk for answer in question.answers]
+                    for question in key.shuffled_for(taker) if question.shuffle_answers}
+        self.assertEqual(attempt['order'], expected)
+        # resuming returns the same attempt
+        self.assertEqual(self.post(self.attempt_url, {}).json()['id'], attempt['id'])
+
+        incomplete = dict(self.data)
+        question_pk = incomplete.popitem()[0]
+        resp = self.post(self.submit_url, {'answers': incomplete})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()['question'], int(question_pk))
+
+        resp = self.post(self.submit_url, {'answers': self.data})
+        self.assertEqual(resp.status_code, 200)
+        result = resp.json()
+        self.assertEqual((result['score'], result['total']), (4, 4))
+        self.assertTrue(all(correct for pk, correct, answer in result['results']))
+        taker.refresh_from_db()
+        self.assertTrue(taker.completed)
+        self.assertEqual(AttemptAnswer.objects.filter(attempt=taker).count(), 4)
+
+        retake = self.post(self.attempt_url, {'retake': True}).json()
+        self.assertNotEqual(retake['id'], attempt['id'])
+        self.assertFalse(retake['completed'])
+
+    def test_requires_login_and_published_course(self):
+        resp = self.client.get(reverse('courses:quiz_app', args=(self.quiz.pk,)))
+        self.assertContains(resp, self.content_url)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.content_url).status_code, 401)
+        self.assertEqual(self.post(self.attempt_url, {}).status_code, 401)
+
+        self.client.login(username='student', password='password')
+        self.course.published = False
+        self.course.save()
+        self.assertEqual(self.client.get(self.content_url).status_code, 404)
+
+
+class RegradeTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', password='password')
+        self.course = Course.objects.create(title="Mechanics", description="Forces",
+                                            teacher=self.teacher, published=True)
+        self.quiz, self.data = make_quiz(self.course, 2)
+        key = AnswerKey.for_quiz(self.quiz.pk)
+        self.mcq, self.uiq = key.questions
+        wrong = self.mcq.answers[1]
+        submissions = [
+            {str(self.mcq.pk): str(self.mcq.correct_answer.pk), str(self.uiq.pk): "9.81"},
+            {str(self.mcq.pk): str(wrong.pk), str(self.uiq.pk): "9.810"},
+            {str(self.mcq.pk): str(wrong.pk), str(self.uiq.pk): "ten"},
+        ]
+        self.attempts = []
+        for i, data in enumerate(submissions):
+            user = User.objects.create_user('student{}'.format(i))
+            attempt = QuizTaker.objects.create(user=user, quiz=self.quiz)
+            save_result(attempt, key.grade(data))
+            self.attempts.append(attempt)
+
+    def scores(self):
+        return [attempt.correct_answers
+                for attempt in QuizTaker.objects.filter(pk__in=[a.pk for a in self.attempts]).order_by('pk')]
+
+    def test_tolerant_text_answers(self):
+        self.assertEqual(self.scores(), [2, 1, 0])
+        self.assertTrue(question_types.texts_match(" 9.81 ", "9.81"))
+        self.assertTrue(question_types.texts_match("9.8100000001", "9.81"))
+        self.assertFalse(question_types.texts_match("9.8", "9.81"))
+
+    def check_regrade(self):
+        # the key was wrong: the second answer is the right one and g is 10
+        Answer.objects.filter(pk=self.mcq.correct_answer.pk).update(correct=False)
+        Answer.objects.filter(pk=self.mcq.answers[1].pk).update(correct=True)
+        Answer.objects.filter(question_id=self.uiq.pk).update(text="1e1")
+        # completed before responses were stored, so there is nothing to regrade it from
+        legacy = QuizTaker.objects.create(user=User.objects.create_user('legacy'), quiz=self.quiz,
+                                          completed=True, correct_answers=2)
+
+        self.assertEqual(regrade_quiz(self.quiz.pk, dry_run=True).changed_scores, 2)
+        self.assertEqual(self.scores(), [2, 1, 0])
+
+        result = regrade_quiz(self.quiz.pk, chunk_size=2)
+        self.assertEqual((result.attempts, result.skipped, result.responses, result.changed_responses,
+                          result.changed_scores), (3, 1, 6, 5, 2))
+        self.assertEqual(self.scores(), [0, 1, 1])
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.correct_answers, 2)
+        self.assertEqual(AttemptAnswer.objects.filter(correct=True).count(), 2)
+        statistic = QuestionStatistic.objects.get(question_id=self.mcq.pk)
+        self.assertEqual((statistic.responses, statistic.correct), (3, 2))
+        # nothing left to fix
+        self.assertEqual(regrade_quiz(self.quiz.pk).changed_responses, 0)
+
+    def test_regrade_numpy(self):
+        if regrade.np is None:
+            self.skipTest('NumPy is not installed')
+        self.check_regrade()
+
+    def test_regrade_python(self):
+        with mock.patch.object(regrade, 'np', None):
+            self.check_regrade()
+
+    def test_long_text_answer_regraded_as_stored(self):
+        key = AnswerKey.for_quiz(self.quiz.pk)
+        # correct in full, but "000...0" and wrong once cut to 255 characters
+        answer = "0" * 300 + "9.81"
+        attempt = QuizTaker.objects.create(user=self.teacher, quiz=self.quiz)
+        save_result(attempt, key.grade({str(self.mcq.pk): str(self.mcq.correct_answer.pk), str(self.uiq.pk): answer}))
+        self.assertEqual(AttemptAnswer.objects.get(attempt=attempt, question_id=self.uiq.pk).text, answer)
+        result = regrade_quiz(self.quiz.pk)
+        self.assertEqual((result.changed_responses, result.changed_scores), (0, 0))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('regrade_quiz', self.quiz.pk, dry_run=True, stdout=out)
+        self.assertIn('0 scores would be changed', out.getvalue())
+        self.assertNotIn('skipped', out.getvalue())
+        QuizTaker.objects.create(user=self.teacher, quiz=self.quiz, completed=True, correct_answers=2)
+        call_command('regrade_quiz', self.quiz.pk, stdout=out)
+        self.assertIn('skipped 1 completed attempts without stored responses', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('regrade_quiz', self.quiz.pk + 100)
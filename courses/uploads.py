@@ -0,0 +1,143 @@
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from . import models
+
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+DEFAULT_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    '''A rejected upload request, carrying the HTTP status to answer with'''
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def upload_dir():
+    return getattr(settings, 'VIDEO_UPLOAD_DIR', os.path.join(settings.MEDIA_ROOT, 'uploads'))
+
+
+def partial_path(upload):
+    return os.path.join(upload_dir(), '{}.part'.format(upload.pk))
+
+
+def parse_content_range(header, upload):
+    '''Returns (start, length) of the chunk described by a Content-Range header'''
+    match = CONTENT_RANGE_RE.match(header or '')
+    if match is None:
+        raise UploadError(400, 'Content-Range must look like "bytes start-end/total"')
+    start, end, total = (int(value) for value in match.groups())
+    if total != upload.size or end < start or end >= total:
+        raise UploadError(400, 'Content-Range does not fit the upload')
+    length = end - start + 1
+    if length > getattr(settings, 'VIDEO_UPLOAD_MAX_CHUNK_SIZE', DEFAULT_MAX_CHUNK_SIZE):
+        raise UploadError(413, 'Chunk is too large')
+    return start, length
+
+
+def write_chunk(upload, stream, start, length, expected_digest=None):
+    '''Writes one chunk from `stream` at `start`, hashing it as it is copied.
+
+    The chunk is written in place before the upload's offset is advanced with a
+    conditional UPDATE, so a retried or concurrent request for the same range
+    cannot move the offset twice. Returns the new offset.'''
+    if upload.completed:
+        raise UploadError(409, 'Upload is already complete')
+    if start != upload.offset:
+        raise UploadError(409, 'Expected a chunk starting at byte {}'.format(upload.offset))
+
+    os.makedirs(upload_dir(), exist_ok=True)
+    path = partial_path(upload)
+    digest = hashlib.sha256()
+    remaining = length
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.seek(start)
+        while remaining > 0:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            digest.update(data)
+            f.write(data)
+            remaining -= len(data)
+    if remaining:
+        raise UploadError(400, 'Chunk body is shorter than its Content-Range')
+    if expected_digest and digest.hexdigest() != expected_digest.lower():
+        raise UploadError(422, 'Chunk checksum mismatch')
+
+    advanced = models.VideoUpload.objects.filter(
+        pk=upload.pk, offset=start, completed=False,
+    ).update(offset=start + length, updated_at=timezone.now())
+    if not advanced:
+        upload.refresh_from_db(fields=['offset', 'completed'])
+        raise UploadError(409, 'Expected a chunk starting at byte {}'.format(upload.offset))
+    upload.offset = start + length
+    return upload.offset
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def assemble(upload):
+    '''Verifies a fully received upload and atomically moves it into place as
+    the step's video'''
+    path = partial_path(upload)
+    with open(path, 'r+b') as f:
+        f.truncate(upload.size)
+    if upload.checksum and file_digest(path) != upload.checksum.lower():
+        os.remove(path)
+        models.VideoUpload.objects.filter(pk=upload.pk).update(offset=0)
+        upload.offset = 0
+        raise UploadError(422, 'File checksum mismatch, restart the upload')
+
+    step = upload.step
+    name = step.video_file.field.generate_filename(step, upload.filename)
+    name = default_storage.get_available_name(name)
+    destination = default_storage.path(name)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    os.replace(path, destination)
+
+    models.Text.objects.filter(pk=step.pk).update(video_file=name)
+    models.VideoUpload.objects.filter(pk=upload.pk).update(completed=True, updated_at=timezone.now())
+    step.video_file.name = name
+    upload.completed = True
+    return name
+
+
+def remove_stale_uploads(max_age):
+    '''Deletes uploads untouched for `max_age` (a timedelta), and partial files with no upload'''
+    cutoff = timezone.now() - max_age
+    stale = models.VideoUpload.objects.filter(updated_at__lt=cutoff)
+    removed = 0
+    for upload in stale.only('id'):
+        try:
+            os.remove(partial_path(upload))
+        except FileNotFoundError:
+            pass
+        removed += 1
+    stale.delete()
+
+    directory = upload_dir()
+    if os.path.isdir(directory):
+        known = {str(pk) for pk in models.VideoUpload.objects.values_list('pk', flat=True)}
+        for entry in os.scandir(directory):
+            upload_id, extension = os.path.splitext(entry.name)
+            if extension == '.part' and upload_id not in known and \
+                    entry.stat().st_mtime < cutoff.timestamp():
+                os.remove(entry.path)
+    return removed
+
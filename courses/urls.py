@@ -1,33 +1,53 @@
+from django.conf import settings
 from django.urls import path, re_path
 
-from . import views
+from . import api, async_views, views
+
+# the read-only catalogue is served by async views under ASGI
+catalogue = async_views if settings.ASYNC_VIEWS else views
 
 app_name = 'courses'
 urlpatterns = [
     # /courses/
-    path('', views.course_list, name='course list view'),
+    path('', catalogue.course_list, name='course list view'),
     # /courses/course_pk
-    path('<int:pk>/', views.course_detail, name='course detail view'),
+    path('<int:pk>/', catalogue.course_detail, name='course detail view'),
     # /courses/course_pk/step_pk
-    path('<int:course_pk>/<int:step_pk>/', views.text_detail, name='text detail view'),
+    path('<int:course_pk>/<int:step_pk>/', catalogue.text_detail, name='text detail view'),
+    # /courses/course_pk/step_pk/video
+    path('<int:course_pk>/<int:step_pk>/video/', views.step_video, name='step video'),
     # /courses/course_pk/quiz/step_pk
     path('<int:course_pk>/quiz/<int:quiz_pk>/', views.quiz_detail, name='quiz detail view'),
     # /courses/course_pk/create_quiz
     path('<int:course_pk>/create_quiz/', views.quiz_create, name='create_quiz'),
     # /courses/course_pk/step_pk
     path('<int:course_pk>/edit_quiz/<int:quiz_pk>/', views.quiz_edit, name='edit_quiz'),
+    # /courses/course_pk/import_quiz and /courses/course_pk/export_quiz/quiz_pk
+    path('<int:course_pk>/import_quiz/', views.quiz_import, name='import_quiz'),
+    path('<int:course_pk>/export_quiz/<int:quiz_pk>/', views.quiz_export, name='export_quiz'),
     # /courses/quiz_pk/create_question/question_type
-    re_path(r'(?P<quiz_pk>\d+)/create_question/(?P<question_type>mc|tf|ui)/$', views.create_question, name='create_question'),
+    re_path(r'(?P<quiz_pk>\d+)/create_question/(?P<question_type>[a-z]+)/$', views.create_question, name='create_question'),
     # /courses/course_pk/step_pk
     path('<int:quiz_pk>/edit_question/<int:question_pk>/', views.edit_question, name='edit_question'),
     # /courses/question_pk/create_answer
     path('<int:question_pk>/create_answer/', views.answer_form, name='create_answer'),
     # /courses/by/teacher
-    path('by/<str:teacher>/', views.courses_by_teacher, name='by_teacher'),
+    path('by/<str:teacher>/', catalogue.courses_by_teacher, name='by_teacher'),
     # /courses/search/
-    path('search/', views.search, name='search'),
+    path('search/', catalogue.search, name='search'),
     # /courses/quiz/quiz_pk/question_pk
     # path('take_quiz/<int:quiz_pk>', views.take_quiz, name='take_quiz'),  # TEST URLS
     path('take_questions/<int:quiz_pk>', views.take_questions, name='take_questions'),  # TEST URLS
+    # /courses/take/quiz_pk, rendered in the browser from the JSON API below
+    path('take/<int:quiz_pk>/', views.quiz_app, name='quiz_app'),
+    # /courses/api/quizzes/quiz_pk/, .../attempt/ and .../submit/
+    path('api/quizzes/<int:quiz_pk>/', api.quiz_content, name='api_quiz_content'),
+    path('api/quizzes/<int:quiz_pk>/attempt/', api.quiz_attempt, name='api_quiz_attempt'),
+    path('api/quizzes/<int:quiz_pk>/submit/', api.quiz_submit, name='api_quiz_submit'),
     path('<str:username>/quiz_result/<int:quiz_pk>', views.quiz_result, name='quiz_result'),  # TEST URLS
+    # /courses/quiz_statistics/quiz_pk
+    path('quiz_statistics/<int:quiz_pk>/', views.quiz_statistics, name='quiz_statistics'),
+    # /courses/uploads/ and /courses/uploads/upload_pk/
+    path('uploads/', views.video_upload_create, name='video_upload_create'),
+    path('uploads/<uuid:upload_pk>/', views.video_upload_detail, name='video_upload_detail'),
 ]
@@ -1,44 +1,63 @@
-from itertools import chain
+import io
 
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth import authenticate, get_user_model, login, logout
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, Count, Sum
-from django.http import HttpResponseRedirect
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
+from django.views.decorators.http import require_http_methods, require_POST
 from django.core.exceptions import MultipleObjectsReturned
 
 from . import forms
+from . import interchange
 from . import models
+from . import question_types
+from . import search as search_index
+from . import uploads
+from .grading import IncompleteSubmission, save_result, start_attempt
+from .pagination import decode_cursor, encode_cursor, paginate_by_pk
+from .payload import get_quiz_payload
+from .stats import item_analysis
+from .streaming import serve_file
+
+COURSES_PER_PAGE = 20
+SEARCH_RESULTS_PER_PAGE = 20
+
 
 # Create your views here.
 def course_list(request):
-    courses = models.Course.objects.filter(
-        published=True
-    ).annotate(total_steps=Count('text', distinct=True) + Count('quiz', distinct=True))
-    total = courses.aggregate(total=Sum('total_steps'))
-    context = {'courses': courses, 'total': total}
+    courses = models.Course.objects.filter(published=True)
+    page = paginate_by_pk(courses, request.GET.get('after'), COURSES_PER_PAGE)
+    context = {'courses': page.items, 'next_cursor': page.next_cursor}
     return render(request, 'courses/course_list.html', context)
 
 
 def course_detail(request, pk):
     course = get_object_or_404(models.Course, pk=pk, published=True)
-    steps = sorted(chain(course.text_set.all(), course.quiz_set.all()),
-                   key=lambda step: step.order)
-    context = {'course': course, 'steps': steps}
+    context = {'course': course}
     return render(request, 'courses/course_detail.html', context)
 
 
 def text_detail(request, course_pk, step_pk):
-    step = get_object_or_404(models.Text, course_id=course_pk, pk=step_pk, course__published=True)
-    steps = sorted(chain(step.course.text_set.all(), step.course.quiz_set.all()),
-                   key=lambda step: step.order)
-    context = {'step': step, 'steps': steps}
+    step = get_object_or_404(models.Text.objects.select_related('course'),
+                             course_id=course_pk, pk=step_pk, course__published=True)
+    context = {'step': step}
     return render(request, 'courses/text_detail.html', context)
 
 
+@require_http_methods(['GET', 'HEAD'])
+def step_video(request, course_pk, step_pk):
+    step = get_object_or_404(models.Text.objects.only('id', 'course_id', 'video_file'),
+                             course_id=course_pk, pk=step_pk, course__published=True)
+    if not step.video_file:
+        raise Http404
+    return serve_file(request, step.video_file)
+
+
 @user_passes_test(lambda u: u.is_superuser or u.is_staff)
 def quiz_create(request, course_pk):
     course = get_object_or_404(models.Course, pk=course_pk, published=True)
@@ -74,12 +93,10 @@ def quiz_edit(request, course_pk, quiz_pk):
 @user_passes_test(lambda u: u.is_superuser or u.is_staff)
 def create_question(request, quiz_pk, question_type):
     quiz = get_object_or_404(models.Quiz, pk=quiz_pk)
-    if question_type == 'tf':
-        form_class = forms.TrueFalseQuestionForm
-    elif question_type == 'ui':
-        form_class = forms.UserInputQuestionForm
-    else:
-        form_class = forms.MultipleChoiceQuestionForm
+    registered = question_types.for_slug(question_type)
+    if registered is None:
+        raise Http404
+    form_class = registered.form_class
 
     form = form_class()
     answer_forms = forms.AnswerInlineFormSet(
@@ -93,17 +110,18 @@ def create_question(request, quiz_pk, question_type):
             queryset=models.Answer.objects.none()
         )
         if form.is_valid() and answer_forms.is_valid():
-            question = form.save(commit=False)
-            question.quiz = quiz
-            question.save()
-            answers = answer_forms.save(commit=False)
+            with transaction.atomic():
+                # counted first, so the saves below invalidate a payload holding the new total
+                models.Quiz.objects.filter(pk=quiz.pk).update(total_questions=F('total_questions') + 1)
+                question = form.save(commit=False)
+                question.quiz = quiz
+                question.save()
+                answers = answer_forms.save(commit=False)
+
+                for answer in answers:
+                    answer.question = question
+                    answer.save()
 
-            for answer in answers:
-                answer.question = question
-                answer.save()
-
-            quiz.total_questions += 1
-            quiz.save()
             messages.success(request, "Added Question")
             return HttpResponseRedirect(quiz.get_absolute_url())
 
@@ -116,16 +134,9 @@ def create_question(request, quiz_pk, question_type):
 
 @user_passes_test(lambda u: u.is_superuser or u.is_staff)
 def edit_question(request, quiz_pk, question_pk):
-    question = get_object_or_404(models.Question, pk=question_pk, quiz_id=quiz_pk)
-    if hasattr(question, 'truefalsequestion'):
-        form_class = forms.TrueFalseQuestionForm
-        question = question.truefalsequestion
-    elif hasattr(question, 'userinputquestion'):
-        form_class = forms.UserInputQuestionForm
-        question = question.userinputquestion
-    else:
-        form_class = forms.MultipleChoiceQuestionForm
-        question = question.multiplechoicequestion
+    question = question_types.concrete(get_object_or_404(
+        question_types.with_subtypes(models.Question.objects.all()), pk=question_pk, quiz_id=quiz_pk))
+    form_class = question_types.for_model(type(question)).form_class
 
     form = form_class(instance=question)
     answer_forms = forms.AnswerInlineFormSet(
@@ -185,9 +196,8 @@ def answer_form(request, question_pk):
 
 @login_required
 def quiz_detail(request, course_pk, quiz_pk):
-    step = get_object_or_404(models.Quiz, course_id=course_pk, pk=quiz_pk, course__published=True)
-    steps = sorted(chain(step.course.text_set.all(), step.course.quiz_set.all()),
-                   key=lambda step: step.order)
+    step = get_object_or_404(models.Quiz.objects.select_related('course'),
+                             course_id=course_pk, pk=quiz_pk, course__published=True)
     curr_user = request.user
 
     try:
@@ -200,12 +210,11 @@ def quiz_detail(request, course_pk, quiz_pk):
     if request.method == 'POST':
         # if quiz_taker wants to retake completed quiz
         if request.POST.get('quiz_take_or_retake', "") == 'retake_quiz':
-            quiz_taker.delete()
-            curr_user.quiztaker_set.create(quiz_id=quiz_pk)
+            start_attempt(curr_user, quiz_pk, retake=True)
             return HttpResponseRedirect(reverse('courses:take_questions', args=(quiz_pk,)))
 
         elif request.POST.get('quiz_take_or_retake', "") == 'take_quiz':
-            curr_user.quiztaker_set.create(quiz_id=quiz_pk)
+            start_attempt(curr_user, quiz_pk)
             return HttpResponseRedirect(reverse('courses:take_questions', args=(quiz_pk,)))
 
         else:
@@ -213,7 +222,6 @@ def quiz_detail(request, course_pk, quiz_pk):
 
     return render(request, 'courses/take_quiz.html', {
                   'step': step,
-                  'steps': steps,
                   'quiz_taker': quiz_taker,
                   'error_message': error_message,
                   })
@@ -221,100 +229,167 @@ def quiz_detail(request, course_pk, quiz_pk):
 
 @login_required
 def take_questions(request, quiz_pk):
-    quiz = get_object_or_404(models.Quiz, pk=quiz_pk)
-    steps = sorted(chain(quiz.course.text_set.all(), quiz.course.quiz_set.all()),
-                   key=lambda step: step.order)
+    payload = get_quiz_payload(quiz_pk)
+    if payload is None:
+        raise Http404
+    quiz, answer_key = payload.quiz, payload.key
     curr_user = request.user
     quiz_taker = curr_user.quiztaker_set.get(quiz_id=quiz_pk)
-    questions = quiz.question_set.all()
-    user_question_answers = []
-    true_question_answers = []
-    user_input_question_correct_or_incorrect = []
-
-    if quiz_taker.correct_answers > 0:
-        quiz_taker.correct_answers = 0
 
     if request.method == 'POST':
+        try:
+            result = answer_key.grade(request.POST)
+        except IncompleteSubmission as error:
+            return render(request, 'courses/take_questions.html', {
+                'questions': answer_key.shuffled_for(quiz_taker),
+                'quiz': quiz,
+                'error_message': str(error),
+            })
 
-        for question in questions:
-
-            if question.question_type == 'UIQ':
-                true_question_answers.append(question.answer_set.get(correct=True))
-                try:
-                    question_id = str(question.pk)
-                    your_answer = request.POST.get(question_id)
-                    user_question_answers.append(your_answer)
-                except (KeyError, models.Answer.DoesNotExist):
-                    return render(request, 'courses/take_questions.html', {
-                        'steps': steps,
-                        'questions': questions,
-                        'quiz': quiz,
-                        'error_message': "You didn't answer a question"
-                    })
-                else:
-                    if your_answer == question.answer_set.get(correct=True).text:
-                        quiz_taker.correct_answers += 1
-                        user_input_question_correct_or_incorrect.append(True)
-                    else:
-                        user_input_question_correct_or_incorrect.append(False)
-
-            else:
-                user_input_question_correct_or_incorrect.append(False)
-                true_question_answers.append(question.answer_set.get(correct=True))
-                try:
-                    question_id = str(question.pk)
-                    your_answer = question.answer_set.get(pk=request.POST.get(question_id))
-                    user_question_answers.append(your_answer)
-                except (KeyError, models.Answer.DoesNotExist):
-                    return render(request, 'courses/take_questions.html', {
-                        'steps': steps,
-                        'questions': questions,
-                        'quiz': quiz,
-                        'error_message': "You didn't answer a question"
-                    })
-                else:
-                    if your_answer.correct is True:
-                        quiz_taker.correct_answers += 1
-
-        quiz_taker.completed = True
-        quiz_taker.save()
-
-        quiz_taker_data = zip(
-            questions,
-            user_question_answers,
-            true_question_answers,
-            user_input_question_correct_or_incorrect,
-        )
+        save_result(quiz_taker, result)
 
         context = {'quiz': quiz,
-                   'steps': steps,
                    'quiz_taker': quiz_taker,
-                   'quiz_taker_data': quiz_taker_data,
+                   'result': result,
                    }
 
         return render(request, 'courses/quiz_result.html', context)
 
     return render(request, 'courses/take_questions.html', {
-        'steps': steps,
-        'questions': questions,
+        'questions': answer_key.shuffled_for(quiz_taker),
         'quiz': quiz
     })
 
+@login_required
+def quiz_app(request, quiz_pk):
+    # the questions are fetched and rendered by courses/js/quiz.js through courses/api.py
+    payload = get_quiz_payload(quiz_pk)
+    if payload is None or not payload.quiz.course.published:
+        raise Http404
+    return render(request, 'courses/quiz_app.html', {'quiz': payload.quiz})
+
+@login_required
 def quiz_result(request, username, quiz_pk):
-    return render(request, 'courses/quiz_result.html')
+    curr_user = request.user
+    if curr_user.username != username and not (curr_user.is_superuser or curr_user.is_staff):
+        raise Http404
+    quiz_taker = get_object_or_404(models.QuizTaker.objects.select_related('user', 'quiz__course'),
+                                   user__username=username, quiz_id=quiz_pk, completed=True)
+    quiz = quiz_taker.quiz
+    result = get_quiz_payload(quiz.pk).key.result_for(quiz_taker)
+
+    return render(request, 'courses/quiz_result.html', {
+        'quiz': quiz,
+        'quiz_taker': quiz_taker,
+        'result': result,
+    })
+
+@user_passes_test(lambda u: u.is_superuser or u.is_staff)
+def quiz_statistics(request, quiz_pk):
+    quiz = get_object_or_404(models.Quiz.objects.select_related('course'), pk=quiz_pk)
+    return render(request, 'courses/quiz_statistics.html', {
+        'quiz': quiz,
+        'items': item_analysis(quiz.pk),
+    })
+
+def upload_status(upload):
+    return {
+        'id': str(upload.pk),
+        'size': upload.size,
+        'offset': upload.offset,
+        'completed': upload.completed,
+    }
+
+
+@user_passes_test(lambda u: u.is_superuser or u.is_staff)
+@require_POST
+def video_upload_create(request):
+    form = forms.VideoUploadForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    upload = form.save(commit=False)
+    upload.user = request.user
+    upload.save()
+    return JsonResponse(upload_status(upload), status=201)
+
+
+@user_passes_test(lambda u: u.is_superuser or u.is_staff)
+@require_http_methods(['GET', 'PUT'])
+def video_upload_detail(request, upload_pk):
+    upload = get_object_or_404(models.VideoUpload.objects.select_related('step'),
+                               pk=upload_pk, user=request.user)
+    if request.method == 'PUT':
+        try:
+            start, length = uploads.parse_content_range(request.META.get('HTTP_CONTENT_RANGE'), upload)
+            uploads.write_chunk(upload, request, start, length, request.META.get('HTTP_X_CHUNK_SHA256'))
+            if upload.offset == upload.size:
+                uploads.assemble(upload)
+        except uploads.UploadError as error:
+            return JsonResponse(dict(upload_status(upload), error=str(error)), status=error.status)
+    return JsonResponse(upload_status(upload))
+
+@user_passes_test(lambda u: u.is_superuser or u.is_staff)
+@require_POST
+def quiz_import(request, course_pk):
+    course = get_object_or_404(models.Course, pk=course_pk)
+    form = forms.QuizImportForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    upload = form.cleaned_data['file']
+    try:
+        data = interchange.read_quiz(io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''),
+                                     interchange.format_for(upload.name))
+        data['title'] = form.cleaned_data['title'] or data['title']
+        data['description'] = form.cleaned_data['description'] or data['description']
+        quiz = interchange.import_quiz(course, data)
+    except (interchange.QuizFormatError, UnicodeDecodeError) as error:
+        return JsonResponse({'errors': {'file': [str(error)]}}, status=400)
+    return JsonResponse({
+        'id': quiz.pk,
+        'questions': quiz.total_questions,
+        'url': quiz.get_absolute_url(),
+    }, status=201)
+
+
+@user_passes_test(lambda u: u.is_superuser or u.is_staff)
+def quiz_export(request, course_pk, quiz_pk):
+    quiz = get_object_or_404(models.Quiz, pk=quiz_pk, course_id=course_pk)
+    format = 'csv' if request.GET.get('format') == 'csv' else 'json'
+    response = StreamingHttpResponse(
+        interchange.export_quiz(quiz, format),
+        content_type='text/csv' if format == 'csv' else 'application/json',
+    )
+    response['Content-Disposition'] = 'attachment; filename="quiz-{}.{}"'.format(quiz.pk, format)
+    return response
 
 ###################################################################
 
 
 def courses_by_teacher(request, teacher):
     courses = models.Course.objects.filter(teacher__username=teacher, published=True)
-    return render(request, 'courses/course_list.html', {'courses': courses})
+    page = paginate_by_pk(courses, request.GET.get('after'), COURSES_PER_PAGE)
+    return render(request, 'courses/course_list.html', {
+        'courses': page.items,
+        'next_cursor': page.next_cursor,
+    })
 
 
 def search(request):
-    term = request.GET.get('q')
-    courses = models.Course.objects.filter(
-        Q(title__icontains=term) | Q(description__icontains=term),  # or
-        published=True,
-    )
-    return render(request, 'courses/course_list.html', {'courses': courses})
+    term = request.GET.get('q', '').strip()
+    after = decode_cursor(request.GET.get('after'), length=2)
+    per_page = SEARCH_RESULTS_PER_PAGE
+
+    # fetch one extra hit to find out whether there is a next page
+    hits = search_index.search(term, limit=per_page + 1, after=after)
+    next_cursor = None
+    if len(hits) > per_page:
+        hits = hits[:per_page]
+        next_cursor = encode_cursor(search_index.hit_cursor(hits[-1]))
+
+    context = {
+        'term': term,
+        'hits': hits,
+        'next_cursor': next_cursor,
+        'paginated': after is not None,
+    }
+    return render(request, 'courses/search_results.html', context)
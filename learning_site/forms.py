@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib.auth import authenticate, get_user_model
 
+from courses.enrollment import users_with_email
+
 
 def must_be_empty(value):
     # validation function for bots
@@ -36,20 +38,27 @@ class UserLoginForm(forms.Form):
     username = forms.CharField()
     password = forms.CharField(widget=forms.PasswordInput)
 
+    def __init__(self, *args, request=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.request = request
+        self.user_cache = None
+
     def clean(self, *args, **kwargs):
         username = self.cleaned_data.get('username')
         password = self.cleaned_data.get('password')
 
         if username and password:
-            user = authenticate(username=username, password=password)
-            if not user:
-                raise forms.ValidationError('This user does not exist')
-            if not user.check_password(password):
-                raise forms.ValidationError('Incorrect password')
-            if not user.is_active:
+            # the only password hash of a login; the view logs in get_user()
+            self.user_cache = authenticate(self.request, username=username, password=password)
+            if not self.user_cache:
+                raise forms.ValidationError('Incorrect username or password')
+            if not self.user_cache.is_active:
                 raise forms.ValidationError('This user is not active')
         return super(UserLoginForm, self).clean(*args, **kwargs)
 
+    def get_user(self):
+        return self.user_cache
+
 
 class UserRegisterForm(forms.ModelForm):
     IB_DIPLOMA = 'ib'
@@ -90,7 +99,6 @@ class UserRegisterForm(forms.ModelForm):
         email2 = self.cleaned_data.get('email2')
         if email != email2:
             raise forms.ValidationError('Emails must match')
-        email_qs = User.objects.filter(email=email)
-        if email_qs.exists():
+        if users_with_email(email).exists():
             raise forms.ValidationError('This email is already taken')
         return super(UserRegisterForm, self).clean(*args, **kwargs)
@@ -0,0 +1,300 @@
+'''Per-view request instrumentation.
+
+InstrumentationMiddleware records, for every request, the number of queries,
+time spent in SQL, time spent rendering templates, total time and response
+size under the resolved URL name. Values go into in-process log-bucket
+histograms that are appended to PERF_LOG_FILE as JSON lines every
+PERF_FLUSH_INTERVAL seconds; `manage.py perf_report` merges the lines from
+every worker and prints percentiles per view.
+'''
+import atexit
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+
+# relative width of a histogram bucket, so percentiles are within ~5%
+GROWTH = 1.1
+LOG_GROWTH = math.log(GROWTH)
+
+METRICS = ['total_ms', 'queries', 'sql_ms', 'template_ms', 'bytes']
+
+UNRESOLVED = '<unresolved>'
+
+# stats of the request being handled; a context variable rather than a
+# thread local, as concurrent async requests share the event loop's thread
+current_stats = contextvars.ContextVar('current_stats', default=None)
+
+
+class Histogram:
+    '''Counts values in logarithmic buckets; bucket None holds zeros'''
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.buckets = {}
+
+    @staticmethod
+    def bucket(value):
+        if value <= 0:
+            return None
+        return math.floor(math.log(value) / LOG_GROWTH)
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        index = self.bucket(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        if not other.count:
+            return
+        self.count += other.count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def percentile(self, p):
+        '''Estimates the value below which `p` percent of the recorded values fall'''
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        # the zero bucket sorts first
+        for index in sorted(self.buckets, key=lambda i: -math.inf if i is None else i):
+            seen += self.buckets[index]
+            if seen >= rank:
+                if index is None:
+                    return 0
+                # geometric middle of the bucket, kept within the observed range
+                return min(max(GROWTH ** (index + 0.5), self.min), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'buckets': {'zero' if i is None else str(i): n for i, n in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.count = data['count']
+        histogram.sum = data['sum']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        histogram.buckets = {None if i == 'zero' else int(i): n for i, n in data['buckets'].items()}
+        return histogram
+
+
+class Recorder:
+    '''Histograms per view and metric for this process, flushed to a JSON-lines file'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.last_flush = time.monotonic()
+
+    def record(self, view, values):
+        with self.lock:
+            histograms = self.views.setdefault(view, {})
+            for metric, value in values.items():
+                if metric not in histograms:
+                    histograms[metric] = Histogram()
+                histograms[metric].add(value)
+
+    def flush_due(self):
+        interval = getattr(settings, 'PERF_FLUSH_INTERVAL', 60)
+        return time.monotonic() - self.last_flush >= interval
+
+    def flush(self):
+        '''Appends one line per view to PERF_LOG_FILE and starts new histograms'''
+        with self.lock:
+            views, self.views = self.views, {}
+            self.last_flush = time.monotonic()
+        path = getattr(settings, 'PERF_LOG_FILE', None)
+        if not views or not path:
+            return
+        now = time.time()
+        lines = [
+            json.dumps({
+                'time': now,
+                'pid': os.getpid(),
+                'view': view,
+                'metrics': {metric: histogram.to_dict() for metric, histogram in histograms.items()},
+            }, separators=(',', ':'))
+            for view, histograms in views.items()
+        ]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # a single append per flush, so lines from several workers do not interleave
+        with open(path, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+recorder = Recorder()
+atexit.register(recorder.flush)
+
+
+def read_log(path, since=None):
+    '''Merges the histograms in a JSON-lines log into {view: {metric: Histogram}}'''
+    views = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # a line cut short by a crash
+                continue
+            if since is not None and entry['time'] < since:
+                continue
+            histograms = views.setdefault(entry['view'], {})
+            for metric, data in entry['metrics'].items():
+                histograms.setdefault(metric, Histogram()).merge(Histogram.from_dict(data))
+    return views
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.elapsed = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    '''Execute wrapper installed on every connection, adding to the current request's stats'''
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_time += time.perf_counter() - start
+        stats.queries += 1
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # connections belong to threads, and under ASGI sync code runs in executor
+    # threads, so the wrapper lives on the connection and finds the request's
+    # stats through the context variable
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None:
+            return super().render(context, request)
+        # templates rendered from within another render are already being timed
+        stats.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_time += time.perf_counter() - start
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    '''DjangoTemplates backend that times renders for InstrumentationMiddleware'''
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+def response_size(response):
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+@contextmanager
+def measure():
+    stats = RequestStats()
+    token = current_stats.set(stats)
+    start = time.perf_counter()
+    try:
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(None, connection)
+        yield stats
+    finally:
+        current_stats.reset(token)
+    stats.elapsed = time.perf_counter() - start
+
+
+def record(request, response, stats):
+    match = request.resolver_match
+    values = {
+        'total_ms': stats.elapsed * 1000,
+        'queries': stats.queries,
+        'sql_ms': stats.sql_time * 1000,
+        'template_ms': stats.template_time * 1000,
+    }
+    size = response_size(response)
+    if size is not None:
+        values['bytes'] = size
+    recorder.record(match.view_name if match else UNRESOLVED, values)
+    if recorder.flush_due():
+        recorder.flush()
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERF_LOG_FILE', None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with measure() as stats:
+            response = self.get_response(request)
+        record(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        with measure() as stats:
+            response = await self.get_response(request)
+        record(request, response, stats)
+        return response
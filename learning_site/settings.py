@@ -42,11 +42,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'debug_toolbar',
-    'courses',
+    'courses.apps.CoursesConfig',
     'django_mathjax',
 ]
 
 MIDDLEWARE = [
+    'learning_site.instrumentation.InstrumentationMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -61,7 +62,9 @@ ROOT_URLCONF = 'learning_site.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for the instrumentation middleware
+        'BACKEND': 'learning_site.instrumentation.InstrumentedTemplates',
+        'NAME': 'django',
         'DIRS': ['templates', ],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,6 +80,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'learning_site.wsgi.application'
+ASGI_APPLICATION = 'learning_site.asgi.application'
+
+# Route the catalogue to courses.async_views; asgi.py turns this on
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS') == '1'
 
 
 # Database
@@ -89,6 +96,49 @@ DATABASES = {
     }
 }
 
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
+# Set DJANGO_DB_PROFILE=production when serving a cohort: connections stay
+# open between requests, write transactions take the lock up front, and
+# courses.db.configure_sqlite applies SQLITE_PRAGMAS to every new connection.
+# Quiz writes retry up to DATABASE_LOCK_RETRIES times on "database is locked",
+# backing off from DATABASE_LOCK_BACKOFF seconds.
+DB_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'development')
+
+SQLITE_PRAGMAS = {}
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 5,
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # in KiB
+        'busy_timeout': 5000,  # in ms
+        'temp_store': 'MEMORY',
+    }
+
+DATABASE_LOCK_RETRIES = 5
+DATABASE_LOCK_BACKOFF = 0.05
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Swap for a shared backend (memcached, redis) when running several workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'learning-site',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -134,11 +184,50 @@ STATICFILES_DIRS = (
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 MEDIA_URL = '/media/'
 
+# Step videos are streamed by courses.views.step_video in VIDEO_CHUNK_SIZE
+# pieces. Set VIDEO_SENDFILE_HEADER to 'X-Sendfile' (Apache, lighttpd) or
+# 'X-Accel-Redirect' (nginx, with an internal location mapping
+# VIDEO_ACCEL_REDIRECT_PREFIX onto MEDIA_ROOT) to hand transfers to the web server.
+VIDEO_CHUNK_SIZE = 64 * 1024
+VIDEO_SENDFILE_HEADER = None
+VIDEO_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Resumable video uploads are written here as they arrive; keep it on the
+# same filesystem as MEDIA_ROOT so finished files can be moved atomically.
+# `manage.py clean_stale_uploads` removes abandoned ones.
+VIDEO_UPLOAD_DIR = os.path.join(MEDIA_ROOT, 'uploads')
+VIDEO_UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'suggestions')
 
+# Suggestion emails are queued in courses.OutboxMessage and sent by
+# `manage.py process_outbox --loop`, which retries failures with backoff
+# starting at OUTBOX_RETRY_BACKOFF seconds, up to OUTBOX_MAX_ATTEMPTS times.
+# A worker holds a batch for OUTBOX_LEASE seconds before others may retry it.
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_BACKOFF = 30
+OUTBOX_LEASE = 300
+
 DEBUG_TOOLBAR_CONFIG = {
-    'SHOW_TOOLBAR_CALLBACK': lambda x: True
+    # read at request time, so test runs and benchmarks (DEBUG off) skip the toolbar
+    'SHOW_TOOLBAR_CALLBACK': 'learning_site.views.show_toolbar',
+    'IS_RUNNING_TESTS': False,
 }
 
+# Per-view query counts and timings from
+# learning_site.instrumentation.InstrumentationMiddleware are appended here
+# every PERF_FLUSH_INTERVAL seconds; summarise them with `manage.py perf_report`.
+# Off unless DJANGO_PERF_LOG_FILE names a file, e.g. perf/requests.jsonl.
+PERF_LOG_FILE = os.environ.get('DJANGO_PERF_LOG_FILE') or None
+PERF_FLUSH_INTERVAL = 60
+
+# keeps test requests out of PERF_LOG_FILE
+TEST_RUNNER = 'learning_site.test_runner.TestRunner'
+
 MATHJAX_ENABLED = True
+
+# markdown2 extras used for step content; run `manage.py render_markdown`
+# after changing them to re-render stored HTML
+MARKDOWN_EXTRAS = []
+MARKDOWN_CACHE_SIZE = 256
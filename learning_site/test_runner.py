@@ -0,0 +1,17 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    '''Runs the tests with the instrumentation middleware off, so test
+    requests never reach PERF_LOG_FILE; InstrumentationTests switch it on
+    against a temporary file.'''
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.perf_log_override = override_settings(PERF_LOG_FILE=None)
+        self.perf_log_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.perf_log_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,13 +1,19 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.urls import reverse
 from django.contrib.auth import authenticate, get_user_model, login, logout
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.http import HttpResponseRedirect
 
 from . import forms
 import courses.models as models
+from courses.outbox import enqueue_mail
+
+def show_toolbar(request):
+    '''Shows the debug toolbar only while DEBUG is on'''
+    return settings.DEBUG
+
 
 def home_view(request):
     return render(request, 'home.html')
@@ -19,7 +25,8 @@ def suggestion_view(request):
     if request.method == 'POST':
         form = forms.SuggestionForm(request.POST)
         if form.is_valid():
-            send_mail(
+            # delivered by `manage.py process_outbox`, outside the request
+            enqueue_mail(
                 'Suggestion from {}'.format(form.cleaned_data['name']),
                 form.cleaned_data['suggestion'],
                 '{name} <{email}>'.format(**form.cleaned_data),
@@ -34,12 +41,9 @@ def suggestion_view(request):
 # login view
 def login_view(request):
     next = request.GET.get('next')
-    form = forms.UserLoginForm(request.POST or None)
+    form = forms.UserLoginForm(request.POST or None, request=request)
     if form.is_valid():
-        username = request.POST['username']
-        password = request.POST['password']
-        user = authenticate(request, username=username, password=password)
-        login(request, user)
+        login(request, form.get_user())
         if next:
             return redirect(next)
         return redirect('/')
@@ -86,6 +90,6 @@ def logout_view(request):
 @login_required
 def profile_view(request):
     curr_user = request.user
-    taken_quizzes = curr_user.quiztaker_set.filter(completed=True)
+    taken_quizzes = curr_user.quiztaker_set.filter(completed=True).select_related('quiz')
     context = {'taken_quizzes': taken_quizzes}
     return render(request, 'user_profile.html', context)